@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Per-lookup cost of the translation rules, precompiled vs. re.match
+
+The "re.match" column reproduces how the rules used to match, passing the
+raw pattern strings to the re module on every call and scanning the whole
+rule map. The "compiled" column uses the precompiled rules and, for whole
+map lookups, the compiled rule index without the result cache.
+
+    python benchmarks/bench_rules.py
+"""
+
+import re
+import timeit
+
+import pymod2pkg
+
+
+def legacy_single(rule, mod, dist):
+    if mod != rule.mod:
+        return None
+    if rule.distmap and dist:
+        for distrex in rule.distmap:
+            if re.match(distrex, dist):
+                return rule.distmap[distrex]
+    return (rule.pkg, rule.py2pkg, rule.py3pkg)
+
+
+def legacy_regex(rule, mod, dist):
+    if re.match(rule.pattern, mod):
+        return rule.pkgfun(mod)
+    return None
+
+
+def legacy_default_rdo_tr(mod):
+    pkg = mod.rsplit('-python')[0]
+    pkg = pkg.replace('_', '-').replace('.', '-').lower()
+    if not pkg.startswith('python-'):
+        pkg = 'python-' + pkg
+    return (pkg, pkg, re.sub('python', 'python3', pkg))
+
+
+def legacy_scan(mod, dist):
+    for rule in pymod2pkg.RDO_PKG_MAP:
+        if type(rule) is pymod2pkg.SingleRule:
+            pkglist = legacy_single(rule, mod, dist)
+        elif type(rule) is pymod2pkg.RegexRule:
+            pkglist = legacy_regex(rule, mod, dist)
+        else:
+            pkglist = rule(mod, dist)
+        if pkglist:
+            return pkglist
+    return legacy_default_rdo_tr(mod)
+
+
+def lookup(mod, dist):
+    cmap = pymod2pkg.compile_pkg_map(pymod2pkg.RDO_PKG_MAP)
+    return cmap.resolve(mod, dist) or pymod2pkg.default_rdo_tr(mod)
+
+
+def bench(func, *args, number=20000):
+    return min(timeit.repeat(lambda: func(*args), number=number,
+                             repeat=5)) / number * 1e6
+
+
+def main():
+    sphinx = pymod2pkg.SingleRule('sphinx', 'python-sphinx',
+                                  distmap={'epel-6': 'python-sphinx10'})
+    xstatic = pymod2pkg.RegexRule(r'^XStatic.*', pymod2pkg.rdo_xstatic_tr)
+    cases = [
+        ('SingleRule distmap hit', legacy_single, sphinx.__call__,
+         (sphinx, 'sphinx', 'fedora'), ('sphinx', 'fedora')),
+        ('RegexRule hit', legacy_regex, xstatic.__call__,
+         (xstatic, 'XStatic-jquery', 'fedora'), ('XStatic-jquery', 'fedora')),
+        ('RegexRule miss', legacy_regex, xstatic.__call__,
+         (xstatic, 'oslo.db', 'fedora'), ('oslo.db', 'fedora')),
+        ('default_rdo_tr', legacy_default_rdo_tr, pymod2pkg.default_rdo_tr,
+         ('oslo.db',), ('oslo.db',)),
+        ('RDO map, exact hit', legacy_scan, lookup,
+         ('PyYAML', 'fedora'), ('PyYAML', 'fedora')),
+        ('RDO map, fallback miss', legacy_scan, lookup,
+         ('oslo.db', 'fedora'), ('oslo.db', 'fedora')),
+    ]
+    print('%-28s %12s %12s' % ('usec per lookup', 're.match', 'compiled'))
+    for name, before, after, before_args, after_args in cases:
+        print('%-28s %12.3f %12.3f' % (
+            name, bench(before, *before_args), bench(after, *after_args)))
+
+
+if __name__ == '__main__':
+    main()
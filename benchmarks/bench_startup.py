@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Startup cost of the command line tools
+
+Runs each command in a fresh interpreter, reports the best wall time and
+the slowest imports seen by `python -X importtime`.
+
+    python benchmarks/bench_startup.py
+"""
+
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    ('pymod2pkg --dist fedora', 'pymod2pkg', ['--dist', 'fedora', 'nova']),
+    ('pymod2pkg', 'pymod2pkg', ['nova']),
+    ('reqs2pkg --help', 'reqs2pkg', ['--help']),
+]
+
+SCRIPT = ('import sys; from pymod2pkg.cli import %s as cli; '
+          'sys.argv = [%r] + sys.argv[1:]; sys.exit(cli.main())')
+
+
+def run(tool, argv, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', SCRIPT % (tool, tool)] + argv
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    return time.perf_counter() - start, proc.stderr
+
+
+def slowest_imports(stderr, count=5):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    for name, tool, argv in COMMANDS:
+        best = min(run(tool, argv)[0] for _ in range(10))
+        print('%-28s %8.1f ms' % (name, best * 1000))
+        for cumulative, module in slowest_imports(run(tool, argv, True)[1]):
+            print('    %-24s %8.1f ms' % (module, cumulative / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmark suite for the translation engine and reqs2pkg
+
+Results are written as JSON so that runs can be compared:
+
+    tox -e bench -- --output before.json
+    # hack, hack
+    tox -e bench -- --output after.json --compare before.json
+
+--compare reports every benchmark that got slower than --threshold and
+exits with 1 if there is any.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+import pymod2pkg
+from pymod2pkg import requirements
+
+DISTS = ['fedora', 'ubuntu', 'suse', 'suse_py39', 'suse_py311']
+
+# (benchmark name, module names, dists)
+TRANSLATIONS = [
+    ('exact', ['PyYAML', 'Babel', 'nova', 'python-novaclient', 'ansible'],
+     DISTS),
+    ('regex.xstatic', ['XStatic-jQuery', 'XStatic-Angular'], ['fedora']),
+    ('regex.horizon', ['manila-ui', 'neutron-fwaas-dashboard'],
+     ['fedora', 'suse']),
+    ('regex.tempest', ['keystone-tempest-plugin', 'nova-tempest-plugin'],
+     ['fedora']),
+    ('default', ['oslo.db', 'stevedore', 'requests'], DISTS),
+]
+
+UPSTREAM = ['keystoneauth1', 'oslo.db', 'openstack-placement']
+
+
+def timed(func, number):
+    """Return the best time per call of func in microseconds"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def bench_translations(number):
+    results = {}
+    for name, mods, dists in TRANSLATIONS:
+        for dist in dists:
+            def run():
+                for mod in mods:
+                    pymod2pkg.module2package(mod, dist, py_vers=['py3'])
+            usec = timed(run, number) / len(mods)
+            results['module2package.%s.%s' % (name, dist)] = usec
+
+    def upstream():
+        for mod in UPSTREAM:
+            pymod2pkg.module2upstream(mod)
+    results['module2upstream'] = timed(upstream, number) / len(UPSTREAM)
+    return results
+
+
+def synthetic_corpus(lines, seed=0):
+    """Yield requirement lines resembling the OpenStack requirements"""
+    names = []
+    for rule in pymod2pkg.RDO_PKG_MAP:
+        if isinstance(rule, pymod2pkg.SingleRule):
+            names.append(rule.mod)
+        elif isinstance(rule, pymod2pkg.MultiRule):
+            names.extend(rule.mods)
+    names += ['oslo.%s' % n for n in ('db', 'config', 'log', 'utils')]
+    names += ['XStatic-Angular', 'manila-ui', 'nova-tempest-plugin']
+    names += ['unknown-%d' % n for n in range(500)]
+    rand = random.Random(seed)
+    for n in range(lines):
+        if n % 20 == 0:
+            yield '# comment %d\n' % n
+            continue
+        line = rand.choice(names)
+        if n % 3 == 0:
+            line += '>=1.%d.0' % (n % 10)
+        if n % 7 == 0:
+            line += ';python_version>="3.6"'
+        yield line + '\n'
+
+
+def bench_reqs2pkg(sizes, tmpdir):
+    results = {}
+    for size in sizes:
+        path = os.path.join(tmpdir, 'requirements-%d.txt' % size)
+        with open(path, 'w') as f:
+            f.writelines(synthetic_corpus(size))
+        for dist in ('fedora', 'ubuntu'):
+            pymod2pkg.cache_clear()
+            start = time.perf_counter()
+            for _ in requirements.iter_translated([path], dist, ['py3']):
+                pass
+            elapsed = time.perf_counter() - start
+            results['reqs2pkg.%s.%d' % (dist, size)] = elapsed * 1e6 / size
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, usec in sorted(results.items()):
+        before = baseline.get(name)
+        if before and usec > before * (1 + threshold):
+            regressions.append('%s: %.3f -> %.3f usec (+%.0f%%)' % (
+                name, before, usec, (usec / before - 1) * 100))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', '-o', help='write the results to a file')
+    parser.add_argument('--compare', help='results of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown ratio reported as a regression '
+                        '(default: %(default)s)')
+    parser.add_argument('--number', type=int, default=2000,
+                        help='calls per timing (default: %(default)s)')
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='comma separated reqs2pkg corpus sizes in lines, '
+                        'e.g. 10000,1000000 (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='disable the translation cache to measure the '
+                        'rule resolution itself')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        pymod2pkg.set_cache_size(0)
+    results = bench_translations(args.number)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        sizes = [int(size) for size in args.sizes.split(',') if size]
+        results.update(bench_reqs2pkg(sizes, tmpdir))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'cache': not args.no_cache,
+        'unit': 'usec per module or requirement line',
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION %s' % regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
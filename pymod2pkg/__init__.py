@@ -10,11 +10,54 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import atexit
+import collections
+import os
 import re
+import sys
+import time
+
+
+# bumped whenever a rule or a RuleList is modified in place, which makes
+# every compiled rule map and cached translation stale
+_RULES_GENERATION = 0
+
+
+def _rules_modified():
+    global _RULES_GENERATION
+    _RULES_GENERATION += 1
 
 
 class TranslationRule(object):
-    pass
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            _rules_modified()
+        object.__setattr__(self, name, value)
+
+
+class RuleList(list):
+    """
+    A rule map or list of module names tracking its modifications
+
+    Translations depending on it are invalidated when it is modified in
+    place. The built-in rule maps and name lists are RuleLists.
+    """
+
+
+def _tracked(name):
+    method = getattr(list, name)
+
+    def modify(self, *args, **kwargs):
+        _rules_modified()
+        return method(self, *args, **kwargs)
+    modify.__name__ = name
+    return modify
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort',
+              'reverse'):
+    setattr(RuleList, _name, _tracked(_name))
 
 
 class SingleRule(TranslationRule):
@@ -32,14 +75,33 @@ class SingleRule(TranslationRule):
         self.py2pkg = py2pkg if py2pkg else pkg
         self.py3pkg = py3pkg if py3pkg else pkg
         self.distmap = distmap
+        self._distrexes = [(re.compile(distrex), distrex)
+                           for distrex in distmap] if distmap else []
+        self._dist_matches = {}
+
+    def __repr__(self):
+        return 'SingleRule(%r, %r)' % (self.mod, self.pkg)
+
+    def _match_dist(self, dist):
+        try:
+            return self._dist_matches[dist]
+        except KeyError:
+            pass
+        match = None
+        for regex, distrex in self._distrexes:
+            if regex.match(dist):
+                match = distrex
+                break
+        self._dist_matches[dist] = match
+        return match
 
     def __call__(self, mod, dist):
         if mod != self.mod:
             return None
         if self.distmap and dist:
-            for distrex in self.distmap:
-                if re.match(distrex, dist):
-                    return self.distmap[distrex]
+            distrex = self._match_dist(dist)
+            if distrex is not None:
+                return self.distmap[distrex]
         return (self.pkg, self.py2pkg, self.py3pkg)
 
 
@@ -48,6 +110,9 @@ class MultiRule(TranslationRule):
         self.mods = mods
         self.pkgfun = pkgfun
 
+    def __repr__(self):
+        return 'MultiRule(%r)' % (self.mods,)
+
     def __call__(self, mod, dist):
         if mod in self.mods:
             pkg, py2pkg, py3pkg = self.pkgfun(mod)
@@ -56,12 +121,19 @@ class MultiRule(TranslationRule):
 
 
 class RegexRule(TranslationRule):
-    def __init__(self, pattern, pkgfun):
+    def __init__(self, pattern, pkgfun, modfun=None):
         self.pattern = pattern
+        self.regex = re.compile(pattern)
         self.pkgfun = pkgfun
+        # the inverse of pkgfun for package2module(), returning the module
+        # names which may translate to a package
+        self.modfun = modfun
+
+    def __repr__(self):
+        return 'RegexRule(%r)' % (self.regex.pattern,)
 
     def __call__(self, mod, dist):
-        if re.match(self.pattern, mod):
+        if self.regex.match(mod):
             pkg, py2pkg, py3pkg = self.pkgfun(mod)
             return (pkg, py2pkg, py3pkg)
         return None
@@ -76,7 +148,7 @@ def default_rdo_tr(mod):
     if not pkg.startswith('python-'):
         pkg = 'python-' + pkg
     py2pkg = pkg
-    py3pkg = re.sub('python', 'python3', pkg)
+    py3pkg = pkg.replace('python', 'python3')
     return (pkg, py2pkg, py3pkg)
 
 
@@ -149,6 +221,21 @@ def suse_horizon_plugins_tr(mod):
     return (pkg, pkg, pkg)
 
 
+def _horizon_plugins_mods(pkg, prefix):
+    if not pkg.startswith(prefix) or not pkg.endswith('-ui'):
+        return []
+    mod = pkg[len(prefix):]
+    return [mod, mod[:-len('ui')] + 'dashboard']
+
+
+def rdo_horizon_plugins_mods(pkg):
+    return _horizon_plugins_mods(pkg, 'openstack-')
+
+
+def suse_horizon_plugins_mods(pkg):
+    return _horizon_plugins_mods(pkg, 'openstack-horizon-plugin-')
+
+
 def rdo_xstatic_tr(mod):
     mod = mod.replace('_', '-').replace('.', '-')
     pkg = 'python-' + mod
@@ -156,15 +243,22 @@ def rdo_xstatic_tr(mod):
     return (pkg, pkg, py3pkg)
 
 
+def rdo_xstatic_mods(pkg):
+    match = _PYTHON_PREFIX.match(pkg)
+    if not match or not pkg.startswith('XStatic', match.end()):
+        return []
+    return [pkg[match.end():]]
+
+
 def same_name_python_subst_python3(mod):
-    py3pkg = re.sub('python', 'python3', mod)
+    py3pkg = mod.replace('python', 'python3')
     return (mod, mod, py3pkg)
 
 
 def subst_python2_python3(mod):
     pkg = mod
-    py2pkg = re.sub('python', 'python2', mod)
-    py3pkg = re.sub('python', 'python3', mod)
+    py2pkg = mod.replace('python', 'python2')
+    py3pkg = mod.replace('python', 'python3')
     return (pkg, py2pkg, py3pkg)
 
 
@@ -176,8 +270,15 @@ def rdo_tempest_plugins_tr(mod):
     return (pkg, py2pkg, py3pkg)
 
 
+def rdo_tempest_plugins_mods(pkg):
+    match = _PYTHON_PREFIX.match(pkg)
+    if not match or not pkg.endswith('-tests-tempest'):
+        return []
+    return [pkg[match.end():-len('tests-tempest')] + 'tempest-plugin']
+
+
 # keep lists in alphabetic order
-SERVICES_MAP = [
+SERVICES_MAP = RuleList([
     'Tempest', 'aodh', 'barbican', 'ceilometer', 'cinder',
     'cloudkitty', 'cyborg', 'designate', 'ec2-api', 'freezer', 'freezer-api',
     'freezer-dr', 'glance', 'heat', 'heat-templates', 'ironic',
@@ -188,10 +289,10 @@ SERVICES_MAP = [
     'monasca-transform', 'murano', 'neutron', 'neutron-fwaas',
     'neutron-lbaas', 'neutron-vpnaas', 'nova', 'octavia', 'placement',
     'rally', 'sahara', 'swift', 'tempest', 'tripleo-common', 'trove', 'tuskar',
-    'vitrage', 'watcher', 'zaqar', 'zun']
+    'vitrage', 'watcher', 'zaqar', 'zun'])
 
 
-RDO_PKG_MAP = [
+RDO_PKG_MAP = RuleList([
     # This demonstrates per-dist filter
     # SingleRule('sphinx', 'python-sphinx',
     #           distmap={'epel-6': 'python-sphinx10'}),
@@ -269,34 +370,37 @@ RDO_PKG_MAP = [
     SingleRule('systemd-python', 'python-systemd', py3pkg='python3-systemd'),
     # simple direct mapping no name change
     MultiRule(
-        mods=['dib-utils', 'diskimage-builder'],
+        mods=RuleList(['dib-utils', 'diskimage-builder']),
         pkgfun=lambda mod: ((mod, mod, mod))),
     # simple direct mapping no name change - except for python3
     MultiRule(
-        mods=['numpy', 'pyflakes', 'pylint',
-              'graphviz',
-              'instack-undercloud',
-              'os-apply-config',
-              'os-collect-config',
-              'os-net-config',
-              'os-refresh-config',
-              'pexpect',
-              'watchdog',
-              'pystache', 'pysendfile'],
+        mods=RuleList(['numpy', 'pyflakes', 'pylint',
+                       'graphviz',
+                       'instack-undercloud',
+                       'os-apply-config',
+                       'os-collect-config',
+                       'os-net-config',
+                       'os-refresh-config',
+                       'pexpect',
+                       'watchdog',
+                       'pystache', 'pysendfile']),
         pkgfun=lambda mod: ((mod, mod, 'python3-' + mod))),
     # OpenStack services
     MultiRule(mods=SERVICES_MAP, pkgfun=openstack_prefix_tr),
     # XStatic projects (name is python-pypi_name, no lowercase conversion)
-    RegexRule(pattern=r'^XStatic.*', pkgfun=rdo_xstatic_tr),
+    RegexRule(pattern=r'^XStatic.*', pkgfun=rdo_xstatic_tr,
+              modfun=rdo_xstatic_mods),
     # Horizon plugins (normalized to openstack-<project>-ui)
     RegexRule(pattern=r'^(neutron-)?\w+-(dashboard|ui)',
-              pkgfun=rdo_horizon_plugins_tr),
+              pkgfun=rdo_horizon_plugins_tr,
+              modfun=rdo_horizon_plugins_mods),
     # Tempest plugins (normalized to python-<project>-tests-tempest)
-    RegexRule(pattern=r'\w+-tempest-plugin', pkgfun=rdo_tempest_plugins_tr)
-]
+    RegexRule(pattern=r'\w+-tempest-plugin', pkgfun=rdo_tempest_plugins_tr,
+              modfun=rdo_tempest_plugins_mods)
+])
 
 
-SUSE_COMMON_PKG_MAP = [
+SUSE_COMMON_PKG_MAP = RuleList([
     # not following SUSE naming policy
     SingleRule('ansible', 'ansible'),
     SingleRule('ansible-runner', 'ansible-runner'),
@@ -305,7 +409,7 @@ SUSE_COMMON_PKG_MAP = [
     MultiRule(mods=SERVICES_MAP, pkgfun=openstack_prefix_tr),
     # OpenStack clients
     MultiRule(
-        mods=['python-%sclient' % c for c in (
+        mods=RuleList(['python-%sclient' % c for c in (
             'barbican', 'ceilometer', 'cinder', 'cloudkitty',
             'congress', 'cue', 'cyborg', 'designate', 'distil', 'drac', 'fuel',
             'freezer', 'heat', 'glance', 'glare', 'ironic',
@@ -314,7 +418,7 @@ SUSE_COMMON_PKG_MAP = [
             'murano', 'nimble', 'neutron', 'nova', 'octavia', 'oneview',
             'openstack', 'sahara', 'scci', 'senlin',
             'smaug', 'solum', 'swift', 'tacker', 'tripleo', 'trove',
-            'vitrage', 'watcher', 'zaqar', 'zun')],
+            'vitrage', 'watcher', 'zaqar', 'zun')]),
         pkgfun=subst_python2_python3),
     SingleRule('devel', 'python-devel', py3pkg='python3-devel'),
     SingleRule('openstack-placement', 'openstack-placement'),
@@ -334,22 +438,45 @@ SUSE_COMMON_PKG_MAP = [
     SingleRule('networking-l2gw', 'openstack-neutron-l2gw'),
     SingleRule('neutron-dynamic-routing', 'openstack-neutron-dynamic-routing'),
     RegexRule(pattern=r'^(neutron-)?\w+-(dashboard|ui)',
-              pkgfun=suse_horizon_plugins_tr),
-]
+              pkgfun=suse_horizon_plugins_tr,
+              modfun=suse_horizon_plugins_mods),
+])
 
-SUSE_PKG_MAP = SUSE_COMMON_PKG_MAP
+SUSE_PY39_OVERLAY = (
+    SingleRule('devel', 'python-devel', py3pkg='python39-devel'),
+)
 
-SUSE_PY39_PKG_MAP = SUSE_COMMON_PKG_MAP
-SUSE_PY39_PKG_MAP.extend([
-    SingleRule('devel', 'python-devel', 'python39-devel'),
-])
+SUSE_PY311_OVERLAY = (
+    SingleRule('devel', 'python-devel', py3pkg='python311-devel'),
+)
 
-SUSE_PY311_PKG_MAP = SUSE_COMMON_PKG_MAP
-SUSE_PY311_PKG_MAP.extend([
-    SingleRule('devel', 'python-devel', 'python311-devel'),
-])
 
-UBUNTU_PKG_MAP = [
+def layered_pkg_map(base, *overlays):
+    """Return a new rule map with overlays taking precedence over base
+
+    The layers are left untouched. SingleRules of lower layers translating
+    a name an upper layer already translates can never match and are left
+    out.
+    """
+    pkg_map = RuleList()
+    names = set()
+    for layer in reversed((base,) + overlays):
+        for rule in layer:
+            if isinstance(rule, SingleRule):
+                if rule.mod in names:
+                    continue
+                names.add(rule.mod)
+            elif isinstance(rule, MultiRule):
+                names.update(rule.mods)
+            pkg_map.append(rule)
+    return pkg_map
+
+
+SUSE_PKG_MAP = layered_pkg_map(SUSE_COMMON_PKG_MAP)
+SUSE_PY39_PKG_MAP = layered_pkg_map(SUSE_COMMON_PKG_MAP, SUSE_PY39_OVERLAY)
+SUSE_PY311_PKG_MAP = layered_pkg_map(SUSE_COMMON_PKG_MAP, SUSE_PY311_OVERLAY)
+
+UBUNTU_PKG_MAP = RuleList([
     SingleRule('glance_store', 'python-glance-store'),
     SingleRule('GitPython', 'python-git'),
     SingleRule('libvirt-python', 'python-libvirt'),
@@ -361,7 +488,7 @@ UBUNTU_PKG_MAP = [
 
     # Openstack clients
     MultiRule(
-        mods=['python-%sclient' % c for c in (
+        mods=RuleList(['python-%sclient' % c for c in (
             'barbican', 'ceilometer', 'cinder', 'cloudkitty', 'congress',
             'designate', 'fuel', 'heat', 'glance', 'ironic',
             'keystone',
@@ -369,48 +496,424 @@ UBUNTU_PKG_MAP = [
             'murano', 'neutron', 'nova', 'octavia',
             'openstack', 'sahara',
             'senlin', 'swift',
-            'trove',  'zaqar', 'zun')],
+            'trove',  'zaqar', 'zun')]),
         pkgfun=same_name_python_subst_python3),
 
-]
+])
 
-OPENSTACK_UPSTREAM_PKG_MAP = [
+OPENSTACK_UPSTREAM_PKG_MAP = RuleList([
     SingleRule('openstack-placement', 'placement'),
     SingleRule('gnocchiclient', 'python-gnocchiclient'),
     SingleRule('aodhclient', 'python-aodhclient'),
     SingleRule('keystoneauth1', 'keystoneauth'),
     SingleRule('microversion_parse', 'microversion-parse'),
     SingleRule('XStatic-smart-table', 'xstatic-angular-smart-table'),
+])
+
+
+class DistProfile(object):
+    """
+    Everything needed to translate for a distribution style
+
+    name: the profile name, which is also a dist string selecting it
+    pkg_map: the rule map
+    default_tr: the default translation function used when no rule matches
+    patterns: a dist string containing any of these (lower case) substrings
+              selects the profile
+    prefix: the dependency field name used by reqs2pkg, e.g. Requires
+    delimiter: the string reqs2pkg joins the packages of a file with, None
+               puts every package on its own prefixed line
+    """
+    def __init__(self, name, pkg_map, default_tr, patterns=(),
+                 prefix='Requires', delimiter=None):
+        self.name = name
+        self.pkg_map = pkg_map
+        self.default_tr = default_tr
+        self.patterns = tuple(patterns)
+        self.prefix = prefix
+        self.delimiter = delimiter
+
+    def __repr__(self):
+        return 'DistProfile(%r)' % (self.name,)
+
+    def matches(self, dist):
+        d_lower = dist.lower()
+        return any(pattern in d_lower for pattern in self.patterns)
+
+
+# checked in order, the more specific patterns first
+_DIST_PROFILES = [
+    DistProfile('suse_py39', SUSE_PY39_PKG_MAP, default_suse_py39_tr,
+                patterns=['suse_py39']),
+    DistProfile('suse_py311', SUSE_PY311_PKG_MAP, default_suse_py311_tr,
+                patterns=['suse_py311']),
+    DistProfile('suse', SUSE_PKG_MAP, default_suse_tr,
+                patterns=['suse', 'sles']),
+    DistProfile('ubuntu', UBUNTU_PKG_MAP, default_ubuntu_tr,
+                patterns=['ubuntu'], prefix='Depends', delimiter=', '),
 ]
+_DEFAULT_DIST_PROFILE = DistProfile('rdo', RDO_PKG_MAP, default_rdo_tr)
+_DIST_PROFILE_CACHE = {}
+
+
+def register_dist_profile(profile):
+    """Register a DistProfile for new distribution styles
+
+    It takes precedence over the profiles registered before it, so more
+    specific patterns have to be registered last.
+    """
+    _DIST_PROFILES.insert(0, profile)
+    _DIST_PROFILE_CACHE.clear()
+    # dist strings handled by another profile so far may be cached
+    _CACHE.invalidate()
+
+
+def dist_profiles():
+    """Return the registered DistProfiles, the default one first"""
+    return [_DEFAULT_DIST_PROFILE] + list(reversed(_DIST_PROFILES))
+
+
+def all_dists():
+    """Return one dist per registered profile, as used by --dist all"""
+    return [profile.name for profile in dist_profiles()]
+
+
+def dist_profile(dist):
+    """Return the DistProfile handling a dist string
+
+    The Fedora/RDO profile handles every dist no other profile matches.
+    """
+    try:
+        return _DIST_PROFILE_CACHE[dist]
+    except KeyError:
+        pass
+    for profile in _DIST_PROFILES:
+        if profile.matches(dist):
+            break
+    else:
+        profile = _DEFAULT_DIST_PROFILE
+    _DIST_PROFILE_CACHE[dist] = profile
+    return profile
 
 
 def get_pkg_map(dist):
-    d_lower = dist.lower()
-    if 'suse_py39' in d_lower:
-        return SUSE_PY39_PKG_MAP
-    if 'suse_py311' in d_lower:
-        return SUSE_PY311_PKG_MAP
-    if 'suse' in d_lower or 'sles' in d_lower:
-        return SUSE_PKG_MAP
-    if 'ubuntu' in d_lower:
-        return UBUNTU_PKG_MAP
-    return RDO_PKG_MAP
+    return dist_profile(dist).pkg_map
 
 
 def get_default_tr_func(dist):
-    d_lower = dist.lower()
-    if 'suse_py39' in d_lower:
-        return default_suse_py39_tr
-    if 'suse_py311' in d_lower:
-        return default_suse_py311_tr
-    if 'suse' in d_lower or 'sles' in d_lower:
-        return default_suse_tr
-    if 'ubuntu' in d_lower:
-        return default_ubuntu_tr
-    return default_rdo_tr
-
-
-def module2package(mod, dist, pkg_map=None, py_vers=('py',)):
+    return dist_profile(dist).default_tr
+
+
+def _scan_rules(rules, mod, dist):
+    for rule in rules:
+        pkglist = rule(mod, dist)
+        if pkglist:
+            return pkglist
+    return None
+
+
+class CompiledRuleMap(object):
+    """
+    Index over a rule map answering first-match-wins lookups
+
+    Exact names from SingleRule and MultiRule go into a dict, the RegexRule
+    patterns are merged into a single alternation which is only tried when
+    the dict misses. Rules of any other type can't be indexed and are still
+    called in order, so the result is always the one the linear scan over
+    the map would give.
+
+    rules: the rule map to index
+    """
+    def __init__(self, rules):
+        # changes are tracked by RuleLists, a plain list can only be
+        # checked for its length
+        self.source = rules
+        self.length = len(rules)
+        self.generation = _RULES_GENERATION
+        self.rules = list(rules)
+        self.reverse_indexes = {}
+        self.normalized = None
+        self.exact = {}
+        self.opaque = []
+        regex_pos = []
+        for pos, rule in enumerate(self.rules):
+            kind = type(rule)
+            if kind is SingleRule:
+                self.exact.setdefault(rule.mod, pos)
+            elif kind is MultiRule:
+                for m in rule.mods:
+                    self.exact.setdefault(m, pos)
+            elif kind is RegexRule:
+                regex_pos.append(pos)
+            else:
+                self.opaque.append(pos)
+        # an exact name is still claimed by a regex rule listed before it
+        for m, pos in self.exact.items():
+            for rpos in regex_pos:
+                if rpos > pos:
+                    break
+                if self.rules[rpos].regex.match(m):
+                    self.exact[m] = rpos
+                    break
+        self._compile_regex(regex_pos)
+
+    def _compile_regex(self, regex_pos):
+        self.regex = None
+        self.regex_groups = {}
+        self.regex_list = [(self.rules[pos].regex, pos) for pos in regex_pos]
+        if not self.regex_list:
+            return
+        # flags of precompiled patterns can't be carried into the alternation
+        if any(r.flags & ~re.UNICODE for r, _ in self.regex_list):
+            return
+        patterns = [r.pattern for r, _ in self.regex_list]
+        # numbered backreferences would shift inside the alternation
+        if any(re.search(r'\\[1-9]', p) for p in patterns):
+            return
+        alternation = '|'.join('(?P<_r%d>%s)' % (i, p)
+                               for i, p in enumerate(patterns))
+        try:
+            regex = re.compile(alternation)
+        except re.error:
+            # e.g. inline global flags or clashing group names
+            return
+        for i, (_, pos) in enumerate(self.regex_list):
+            self.regex_groups[regex.groupindex['_r%d' % i]] = pos
+        self.regex = regex
+
+    def is_current(self, rules):
+        """Check the indexed map wasn't modified since it was compiled
+
+        Modifications are noticed in constant time for RuleLists and rule
+        attribute assignments, other in-place modifications of a plain list
+        than adding or removing rules aren't, see cache_clear().
+        """
+        return (self.generation == _RULES_GENERATION
+                and self.source is rules and self.length == len(rules))
+
+    def lookup(self, mod):
+        """Return the position of the first indexed rule matching mod"""
+        pos = self.exact.get(mod)
+        if pos is not None:
+            return pos
+        if self.regex is not None:
+            m = self.regex.match(mod)
+            if m:
+                return self.regex_groups[m.lastindex]
+            return None
+        for regex, pos in self.regex_list:
+            if regex.match(mod):
+                return pos
+        return None
+
+    def normalized_index(self):
+        """Return a dict mapping canonical names to the exact names
+
+        Values are (position, name) pairs, the first rule wins when several
+        exact names have the same canonical name.
+        """
+        if self.normalized is None:
+            normalized = {}
+            for mod, pos in self.exact.items():
+                key = canonical_name(mod)
+                if key not in normalized or pos < normalized[key][0]:
+                    normalized[key] = (pos, mod)
+            self.normalized = normalized
+        return self.normalized
+
+    def find(self, mod, dist, normalize=False):
+        """Return the position of the matching rule and its result
+
+        Both are None when no rule matches mod. With normalize, a name no
+        exact rule matches verbatim is also looked up by its canonical
+        name, and the matching rule is applied to its own spelling.
+        """
+        pos = self.lookup(mod)
+        name = mod
+        if normalize and mod not in self.exact:
+            npos, nname = self.normalized_index().get(canonical_name(mod),
+                                                      (None, None))
+            if npos is not None and (pos is None or npos < pos):
+                pos, name = npos, nname
+        if self.opaque:
+            end = len(self.rules) if pos is None else pos
+            for opos in self.opaque:
+                if opos >= end:
+                    break
+                pkglist = self.rules[opos](mod, dist)
+                if pkglist:
+                    return (opos, pkglist)
+        if pos is None:
+            return (None, None)
+        pkglist = self.rules[pos](name, dist)
+        if pkglist:
+            return (pos, pkglist)
+        for pos in range(pos + 1, len(self.rules)):
+            pkglist = self.rules[pos](mod, dist)
+            if pkglist:
+                return (pos, pkglist)
+        return (None, None)
+
+    def resolve(self, mod, dist):
+        """Return the (pkg, py2pkg, py3pkg) tuple for mod or None"""
+        return self.find(mod, dist)[1]
+
+    def reverse_index(self, dist):
+        """Return a dict mapping package names to the exact names of dist
+
+        Only the translation that actually wins for each name is indexed.
+        """
+        index = self.reverse_indexes.get(dist)
+        if index is None:
+            index = {}
+            for mod in self.exact:
+                pkglist = self.resolve(mod, dist)
+                if not pkglist:
+                    continue
+                if isinstance(pkglist, str):
+                    pkglist = (pkglist,)
+                for pkg in pkglist:
+                    mods = index.setdefault(pkg, [])
+                    if mod not in mods:
+                        mods.append(mod)
+            self.reverse_indexes[dist] = index
+        return index
+
+
+def rule_map_digest(rules):
+    """Return a digest of the types, names and patterns of the rules"""
+    import hashlib
+    import marshal
+
+    keys = []
+    for rule in rules:
+        kind = type(rule)
+        if kind is SingleRule:
+            keys.append(('s', rule.mod))
+        elif kind is MultiRule:
+            keys.append(('m', tuple(rule.mods)))
+        elif kind is RegexRule:
+            keys.append(('r', rule.regex.pattern, rule.regex.flags))
+        else:
+            keys.append(('o',))
+    return hashlib.sha256(marshal.dumps(tuple(keys))).hexdigest()
+
+
+_COMPILED_MAPS = {}
+_COMPILED_MAPS_MAX = 64
+
+
+def compile_pkg_map(pkg_map):
+    """Return the CompiledRuleMap for pkg_map, rebuilding it when stale"""
+    cmap = _COMPILED_MAPS.get(id(pkg_map))
+    if cmap is None or not cmap.is_current(pkg_map):
+        cmap = CompiledRuleMap(pkg_map)
+        if len(_COMPILED_MAPS) >= _COMPILED_MAPS_MAX:
+            _COMPILED_MAPS.clear()
+        _COMPILED_MAPS[id(pkg_map)] = cmap
+    return cmap
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class TranslationCache(object):
+    """
+    Bounded LRU cache for translation results
+
+    Every entry remembers the rule map it was computed from together with
+    its CompiledRuleMap. An entry whose map was modified since is treated
+    as a miss, so mutating a rule map invalidates the results that depend
+    on it.
+
+    maxsize: the maximum number of entries, 0 disables the cache
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, rules, cmap = entry
+            if cmap.is_current(rules):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value, rules, cmap):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = (value, rules, cmap)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > max(maxsize, 0):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        self.entries.clear()
+
+    def clear(self):
+        self.invalidate()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.maxsize, len(self.entries))
+
+
+_CACHE = TranslationCache()
+
+
+def cache_info():
+    """Return hit/miss/eviction statistics of the translation cache"""
+    return _CACHE.info()
+
+
+def cache_clear():
+    """Drop all cached translations and rule indexes, reset the statistics
+
+    Call it after modifying rules in ways that aren't noticed, e.g. a plain
+    list of names used by a MultiRule.
+    """
+    _CACHE.clear()
+    _COMPILED_MAPS.clear()
+
+
+def set_cache_size(maxsize):
+    """Bound the translation cache to maxsize entries, 0 disables it"""
+    _CACHE.resize(maxsize)
+
+
+_VERSION_INDEX = {'py': 0, 'py2': 1, 'py3': 2}
+
+
+def _version_indexes(py_vers):
+    try:
+        return tuple(_VERSION_INDEX[v] for v in py_vers)
+    except KeyError as ex:
+        raise Exception('Invalid version "%s"' % (ex.args[0]))
+
+
+def canonical_name(name):
+    """Return the PEP 503 normalized form of a python project name"""
+    return _SEPARATORS.sub('-', name).lower()
+
+
+def module2package(mod, dist, pkg_map=None, py_vers=('py',),
+                   normalize=False, table=None):
     """Return a corresponding package name for a python module.
 
     mod: python module name
@@ -421,33 +924,277 @@ def module2package(mod, dist, pkg_map=None, py_vers=('py',)):
     py_vers: a list of python versions the function should return. Default is
              'py' which is the unversioned translation. Possible values are
              'py', 'py2' and 'py3'
+    normalize: also match the rules spelling mod differently, e.g. PyYAML
+               for pyyaml or py_yaml. A rule spelling it exactly still wins
+    table: a pymod2pkg.table.MappingTable consulted ahead of the rules
+
+    Results are memoized, see cache_info(), cache_clear() and
+    set_cache_size().
     """
-    if not pkg_map:
-        pkg_map = get_pkg_map(dist)
-    for rule in pkg_map:
-        pkglist = rule(mod, dist)
+    py_vers = tuple(py_vers)
+    key = (mod, dist, id(pkg_map) if pkg_map else None, py_vers,
+           normalize, table.digest if table is not None else None)
+    entry = _CACHE.get(key)
+    if entry is None:
+        if not pkg_map:
+            pkg_map = get_pkg_map(dist)
+        cmap = compile_pkg_map(pkg_map)
+        pkglist = table.get(mod) if table is not None else None
         if pkglist:
-            break
-    else:
-        tr_func = get_default_tr_func(dist)
-        pkglist = tr_func(mod)
-
-    output = []
-    for v in py_vers:
-        if v == 'py':
-            output.append(pkglist[0])
-        elif v == 'py2':
-            output.append(pkglist[1])
-        elif v == 'py3':
-            output.append(pkglist[2])
+            pos = 'table'
         else:
-            raise Exception('Invalid version "%s"' % (v))
+            pos, pkglist = cmap.find(mod, dist, normalize)
+        if not pkglist:
+            tr_func = get_default_tr_func(dist)
+            pkglist = tr_func(mod)
+        entry = (tuple(pkglist[i] for i in _version_indexes(py_vers)), pos)
+        _CACHE.put(key, entry, pkg_map, cmap)
+    output, pos = entry
+    if _RULE_STATS is not None:
+        _RULE_STATS.record(dist, pkg_map or get_pkg_map(dist), pos)
 
     if len(output) == 1:
         # just return a single value (backwards compatible)
         return output[0]
     else:
-        return output
+        return list(output)
+
+
+def module2packages(mods, dist, pkg_map=None, py_vers=('py',),
+                    normalize=False, table=None):
+    """Return a dict mapping python modules to package names.
+
+    mods: an iterable of python module names, it is consumed only once so
+          a generator can be streamed through
+    dist: a linux distribution, see module2package()
+    pkg_map: a custom package mapping. None means autodetected based on the
+             given dist parameter
+    py_vers: a list of python versions to return for each module, see
+             module2package()
+    normalize: match the rules spelling names differently, see
+               module2package()
+    table: a mapping table consulted ahead of the rules, see
+           module2package()
+
+    Duplicated module names are translated only once. Each value is a tuple
+    with one package name per requested python version.
+    """
+    indexes = _version_indexes(py_vers)
+    if not pkg_map:
+        pkg_map = get_pkg_map(dist)
+    cmap = compile_pkg_map(pkg_map)
+    tr_func = get_default_tr_func(dist)
+    result = {}
+    positions = {}
+    for mod in mods:
+        if mod not in result:
+            pkglist = table.get(mod) if table is not None else None
+            if pkglist:
+                pos = 'table'
+            else:
+                pos, pkglist = cmap.find(mod, dist, normalize)
+            if not pkglist:
+                pkglist = tr_func(mod)
+            result[mod] = tuple(pkglist[i] for i in indexes)
+            positions[mod] = pos
+        if _RULE_STATS is not None:
+            _RULE_STATS.record(dist, pkg_map, positions[mod])
+    return result
+
+
+def module2package_matrix(mods, dists=None, py_vers=('py',),
+                          normalize=False):
+    """Translate python modules for several distributions at once.
+
+    mods: an iterable of python module names, consumed only once
+    dists: the linux distributions to translate for, default all_dists()
+    py_vers: a list of python versions to return, see module2package()
+    normalize: match the rules spelling names differently, see
+               module2package()
+
+    Returns a dict mapping each distinct module name to a dict mapping each
+    dist to a tuple with one package name per requested python version.
+    The input is read and deduplicated once, only the rule resolution is
+    repeated for every dist.
+    """
+    indexes = _version_indexes(py_vers)
+    resolvers = []
+    for dist in dists or all_dists():
+        pkg_map = get_pkg_map(dist)
+        resolvers.append((dist, pkg_map, compile_pkg_map(pkg_map),
+                          get_default_tr_func(dist)))
+    result = {}
+    positions = {}
+    for mod in mods:
+        if mod not in result:
+            row = result[mod] = {}
+            positions[mod] = []
+            for dist, _, cmap, tr_func in resolvers:
+                pos, pkglist = cmap.find(mod, dist, normalize)
+                if not pkglist:
+                    pkglist = tr_func(mod)
+                row[dist] = tuple(pkglist[i] for i in indexes)
+                positions[mod].append(pos)
+        if _RULE_STATS is not None:
+            for (dist, pkg_map, _, _), pos in zip(resolvers,
+                                                  positions[mod]):
+                _RULE_STATS.record(dist, pkg_map, pos)
+    return result
+
+
+Explanation = collections.namedtuple(
+    'Explanation', ['mod', 'dist', 'rule', 'position', 'scanned', 'pkgs',
+                    'seconds'])
+
+
+def explain(mod, dist, pkg_map=None, table=None):
+    """Explain how module2package() translates a python module.
+
+    Returns an Explanation with the matching rule (the default translation
+    function when no rule matches, the mapping table when it has mod), its
+    position in the rule map (None for the default translation, 'table' for
+    the mapping table), the number of rules a linear scan of the map
+    evaluates to find it, the (pkg, py2pkg, py3pkg) result and the time the
+    translation took in seconds, bypassing the translation cache.
+    """
+    if not pkg_map:
+        pkg_map = get_pkg_map(dist)
+    cmap = compile_pkg_map(pkg_map)
+    start = time.perf_counter()
+    pkglist = table.get(mod) if table is not None else None
+    if pkglist:
+        pos = 'table'
+        rule = table
+    else:
+        pos, pkglist = cmap.find(mod, dist)
+        if pkglist:
+            rule = cmap.rules[pos]
+        else:
+            rule = get_default_tr_func(dist)
+            pkglist = rule(mod)
+    seconds = time.perf_counter() - start
+    if pos == 'table':
+        scanned = 0
+    else:
+        scanned = len(cmap.rules) if pos is None else pos + 1
+    return Explanation(mod, dist, rule, pos, scanned, tuple(pkglist),
+                       seconds)
+
+
+class RuleStats(object):
+    """
+    Count the translations done by each rule of each dist
+
+    Translations done by the default translation functions are counted
+    as fallbacks, the ones found in a mapping table as table.
+    """
+    def __init__(self):
+        self.counts = {}
+
+    def record(self, dist, rules, pos):
+        key = (dist, id(rules))
+        entry = self.counts.get(key)
+        if entry is None:
+            entry = self.counts[key] = (rules, collections.Counter())
+        entry[1][pos] += 1
+
+    def report(self):
+        """Return the counts by dist, including the rules never used"""
+        report = {}
+        for (dist, _), (rules, counts) in sorted(self.counts.items(),
+                                                 key=lambda i: i[0][0]):
+            report[dist] = {
+                'fallback': counts[None],
+                'table': counts['table'],
+                'rules': [{'position': pos, 'rule': repr(rule),
+                           'hits': counts[pos]}
+                          for pos, rule in enumerate(rules)],
+            }
+        return report
+
+    def dump(self, path):
+        """Write report() as JSON to path, '-' meaning stderr"""
+        import json
+
+        report = json.dumps(self.report(), indent=2, sort_keys=True)
+        if path == '-':
+            sys.stderr.write(report + '\n')
+        else:
+            with open(path, 'w') as f:
+                f.write(report + '\n')
+
+
+_RULE_STATS = None
+
+
+def enable_rule_stats(dump_path=None):
+    """Start counting rule hits process-wide and return the RuleStats
+
+    dump_path: write the counts as JSON to this file when the process exits,
+               '-' writes them to stderr
+    """
+    global _RULE_STATS
+    if _RULE_STATS is None:
+        _RULE_STATS = RuleStats()
+        if dump_path:
+            atexit.register(_RULE_STATS.dump, dump_path)
+    return _RULE_STATS
+
+
+def disable_rule_stats():
+    """Stop counting rule hits"""
+    global _RULE_STATS
+    _RULE_STATS = None
+
+
+_PYTHON_PREFIX = re.compile(r'python\d*-')
+_SEPARATORS = re.compile(r'[-_.]+')
+
+
+def package2module(pkg, dist, pkg_map=None):
+    """Return the python modules translated to a package name.
+
+    pkg: a package name of any python version, e.g. python3-pyyaml
+    dist: a linux distribution, see module2package()
+    pkg_map: a custom package mapping. None means autodetected based on the
+             given dist parameter
+
+    Returns a list of candidates, empty when the package isn't known: the
+    names of the rules translating to pkg in rule map order, then the names
+    the RegexRules with a modfun give for pkg or, when there are none, the
+    name the default translation function would turn into pkg. Guessed
+    names are only returned when they translate to pkg and aren't just
+    another spelling of a rule name (as pyyaml is of PyYAML). The
+    translations are lossy, e.g. Fedora/RDO turns both oslo.db and oslo_db
+    into python-oslo-db, so the guessed name is the normalized one.
+    """
+    if not pkg_map:
+        pkg_map = get_pkg_map(dist)
+    cmap = compile_pkg_map(pkg_map)
+    mods = list(cmap.reverse_index(dist).get(pkg, ()))
+    known = set(canonical_name(m) for m in mods)
+
+    def add(guesses):
+        found = False
+        for mod in guesses:
+            if pkg not in module2package(mod, dist, pkg_map,
+                                         py_vers=('py', 'py2', 'py3')):
+                continue
+            found = True
+            if canonical_name(mod) not in known:
+                known.add(canonical_name(mod))
+                mods.append(mod)
+        return found
+
+    owned = False
+    for _, pos in cmap.regex_list:
+        modfun = cmap.rules[pos].modfun
+        if modfun is not None and add(modfun(pkg)):
+            owned = True
+    match = _PYTHON_PREFIX.match(pkg)
+    if match and not owned:
+        add([pkg[match.end():]])
+    return mods
 
 
 def module2upstream(mod):
@@ -455,8 +1202,15 @@ def module2upstream(mod):
 
     mod  -- python module name
     """
-    for rule in OPENSTACK_UPSTREAM_PKG_MAP:
-        pkglist = rule(mod, dist=None)
-        if pkglist:
-            return pkglist[0]
-    return mod
+    key = (mod, None, id(OPENSTACK_UPSTREAM_PKG_MAP), None)
+    name = _CACHE.get(key)
+    if name is None:
+        cmap = compile_pkg_map(OPENSTACK_UPSTREAM_PKG_MAP)
+        pkglist = cmap.resolve(mod, None)
+        name = pkglist[0] if pkglist else mod
+        _CACHE.put(key, name, OPENSTACK_UPSTREAM_PKG_MAP, cmap)
+    return name
+
+
+if os.environ.get('PYMOD2PKG_RULE_STATS'):
+    enable_rule_stats(os.environ['PYMOD2PKG_RULE_STATS'])
@@ -0,0 +1,292 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Static analysis of rule maps
+
+Rules are tried in order and the first match wins, so a rule every name of
+which is translated by an earlier rule can never fire, and two rules able
+to match the same name must keep their relative order. This module reports
+both and, from the hit counts recorded by RuleStats, proposes an order with
+the hot rules first which only swaps rules that can't match a common name:
+
+    python -m pymod2pkg.analyze [--dist DIST] [--stats FILE] [--corpus FILE]
+
+It exits with 1 when a map has dead rules or a proposed order translates a
+name of the corpus differently.
+"""
+
+import argparse
+import collections
+import json
+import re
+import sys
+
+import pymod2pkg
+
+ShadowedRule = collections.namedtuple(
+    'ShadowedRule', ['position', 'rule', 'dead', 'names', 'shadowed_by'])
+
+# characters ending the literal prefix of a pattern
+_META = set('.^$*+?{}[]()|\\')
+
+
+def exact_names(rule):
+    """Return the names a SingleRule or MultiRule matches, None otherwise"""
+    kind = type(rule)
+    if kind is pymod2pkg.SingleRule:
+        return [rule.mod]
+    if kind is pymod2pkg.MultiRule:
+        return list(rule.mods)
+    return None
+
+
+def literal_prefix(pattern):
+    """Return the literal text every match of a pattern starts with"""
+    if '|' in pattern:
+        # a top-level alternation could start with anything
+        return ''
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and not \
+                pattern[i + 1].isalnum():
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if c in _META:
+            # the last character may be optional or repeated
+            if c in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(c)
+        i += 1
+    return ''.join(prefix)
+
+
+def may_overlap(a, b):
+    """Check whether two rules may match a common name
+
+    False is only returned when no name can match both, rules of unknown
+    types and regexes which aren't provably disjoint may overlap.
+    """
+    names_a, names_b = exact_names(a), exact_names(b)
+    if names_a is not None and names_b is not None:
+        return not set(names_a).isdisjoint(names_b)
+    regex_kind = pymod2pkg.RegexRule
+    if names_a is not None and type(b) is regex_kind:
+        return any(b.regex.match(n) for n in names_a)
+    if names_b is not None and type(a) is regex_kind:
+        return any(a.regex.match(n) for n in names_b)
+    if type(a) is regex_kind and type(b) is regex_kind:
+        if (a.regex.flags | b.regex.flags) & re.IGNORECASE:
+            return True
+        pa = literal_prefix(a.regex.pattern)
+        pb = literal_prefix(b.regex.pattern)
+        return pa.startswith(pb) or pb.startswith(pa)
+    return True
+
+
+def shadowed_rules(pkg_map):
+    """Return a ShadowedRule per rule some names of which can't match
+
+    dead is true when none of the names of the rule can match, names lists
+    the shadowed names (the pattern for a RegexRule) and shadowed_by the
+    positions of the earlier rules translating them. Rules of unknown
+    types are assumed to match nothing.
+    """
+    shadowed = []
+    claimed = {}
+    regexes = []
+    for pos, rule in enumerate(pkg_map):
+        names = exact_names(rule)
+        if names is None:
+            if type(rule) is pymod2pkg.RegexRule:
+                key = (rule.regex.pattern, rule.regex.flags)
+                for rpos, other in regexes:
+                    if (other.regex.pattern, other.regex.flags) == key:
+                        shadowed.append(ShadowedRule(
+                            pos, rule, True, [rule.regex.pattern], [rpos]))
+                        break
+                regexes.append((pos, rule))
+            continue
+        hidden = []
+        by = set()
+        for name in names:
+            if name in claimed:
+                hidden.append(name)
+                by.add(claimed[name])
+                continue
+            for rpos, other in regexes:
+                if other.regex.match(name):
+                    hidden.append(name)
+                    by.add(rpos)
+                    break
+            else:
+                claimed[name] = pos
+        if hidden:
+            shadowed.append(ShadowedRule(pos, rule, len(hidden) == len(names),
+                                         hidden, sorted(by)))
+    return shadowed
+
+
+def order_dependencies(pkg_map):
+    """Return the (earlier, later) position pairs of rules that may overlap
+
+    Swapping any such pair may change the result for some name.
+    """
+    pairs = []
+    for j, later in enumerate(pkg_map):
+        for i in range(j):
+            if may_overlap(pkg_map[i], later):
+                pairs.append((i, j))
+    return pairs
+
+
+def reorder(pkg_map, hits):
+    """Propose an order of pkg_map with the most hit rules first
+
+    hits: a dict mapping rule positions to their hit counts
+
+    Returns the list of the original positions in the proposed order. Only
+    adjacent rules which can't match a common name are swapped, so the
+    reordered map translates every name as the original one does.
+    """
+    order = list(range(len(pkg_map)))
+    overlaps = {}
+
+    def overlap(a, b):
+        key = (min(a, b), max(a, b))
+        try:
+            return overlaps[key]
+        except KeyError:
+            result = overlaps[key] = may_overlap(pkg_map[a], pkg_map[b])
+            return result
+
+    changed = True
+    while changed:
+        changed = False
+        for k in range(len(order) - 1):
+            a, b = order[k], order[k + 1]
+            if hits.get(b, 0) > hits.get(a, 0) and not overlap(a, b):
+                order[k], order[k + 1] = b, a
+                changed = True
+    return order
+
+
+def hits_from_stats(report, dist, pkg_map):
+    """Return the hit counts of pkg_map from a RuleStats report
+
+    report is the result of RuleStats.report() or its JSON dump. It is
+    keyed by the dist names translations were asked for, the counts of all
+    the dists of the same style as dist are added up, e.g. fedora and
+    centos for rdo. None is returned when there are none, and a ValueError
+    is raised when they were all recorded for another map.
+    """
+    style = pymod2pkg.dist_profile(dist).name
+    names = [repr(rule) for rule in pkg_map]
+    hits = None
+    other_map = False
+    for recorded, entry in sorted(report.items()):
+        if pymod2pkg.dist_profile(recorded).name != style:
+            continue
+        if [r['rule'] for r in entry['rules']] != names:
+            other_map = True
+            continue
+        hits = hits or {}
+        for r in entry['rules']:
+            hits[r['position']] = hits.get(r['position'], 0) + r['hits']
+    if hits is None and other_map:
+        raise ValueError('The stats of %s were recorded for another rule map'
+                         % dist)
+    return hits
+
+
+def verify_order(pkg_map, order, dist, mods):
+    """Return the names of mods the reordered map translates differently"""
+    reordered = [pkg_map[pos] for pos in order]
+    return [mod for mod in mods
+            if pymod2pkg._scan_rules(pkg_map, mod, dist)
+            != pymod2pkg._scan_rules(reordered, mod, dist)]
+
+
+def corpus(pkg_map, extra=()):
+    """Return the exact names of pkg_map followed by the extra names"""
+    names = {}
+    for rule in pkg_map:
+        names.update(dict.fromkeys(exact_names(rule) or []))
+    names.update(dict.fromkeys(extra))
+    return list(names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Report the dead and order dependent rules of the rule '
+                    'maps and propose a faster order')
+    parser.add_argument('--dist', action='append', default=[],
+                        help='distribution style to analyze, can be '
+                        'repeated (default: one of each supported style)')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='rule hit counts written by '
+                        'PYMOD2PKG_RULE_STATS, proposes an order from them')
+    parser.add_argument('--corpus', metavar='FILE',
+                        help='python module names, one per line, checked to '
+                        'translate identically with the proposed order in '
+                        'addition to the names of the rules')
+    args = parser.parse_args(argv)
+
+    stats = None
+    if args.stats:
+        with open(args.stats) as f:
+            stats = json.load(f)
+    extra = []
+    if args.corpus:
+        with open(args.corpus) as f:
+            extra = [line.strip() for line in f if line.strip()]
+
+    ret = 0
+    matched = False
+    for dist in args.dist or pymod2pkg.all_dists():
+        pkg_map = pymod2pkg.get_pkg_map(dist)
+        print('[%s] %d rules' % (dist, len(pkg_map)))
+        for s in shadowed_rules(pkg_map):
+            if s.dead:
+                ret = 1
+            print('  %s rule %d %r: %s shadowed by rule %s' % (
+                'dead' if s.dead else 'partly shadowed', s.position, s.rule,
+                ', '.join(s.names), ', '.join(map(str, s.shadowed_by))))
+        for i, j in order_dependencies(pkg_map):
+            print('  rule %d %r must stay before rule %d %r' % (
+                i, pkg_map[i], j, pkg_map[j]))
+        hits = None if stats is None else hits_from_stats(stats, dist,
+                                                          pkg_map)
+        if hits is None:
+            continue
+        matched = True
+        order = reorder(pkg_map, hits)
+        changed = verify_order(pkg_map, order, dist,
+                               corpus(pkg_map, extra))
+        if changed:
+            ret = 1
+            print('  proposed order changes: %s' % ', '.join(changed))
+        print('  proposed order: %s' % ' '.join(map(str, order)))
+    if stats is not None and not matched:
+        print('No stats recorded in %s for the analyzed dists: %s' % (
+            args.stats, ', '.join(sorted(stats)) or 'none'), file=sys.stderr)
+        ret = 1
+    return ret
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def detect_dist():
+    """Return the distribution style of the running system
+
+    distro reads os-release and may even run lsb_release, so it is only
+    imported and queried when --dist isn't given.
+    """
+    import distro
+    return distro.LinuxDistribution().id().partition(' ')[0]
@@ -11,9 +11,152 @@
 #    under the License.
 
 import argparse
-import distro
+import io
+import json
+import os
+import sys
 
 import pymod2pkg
+from pymod2pkg.cli import detect_dist
+
+
+def translate(mod, dist, pyversions, upstream):
+    """Return the output line for a module as printed by the CLI"""
+    if upstream:
+        return pymod2pkg.module2upstream(mod)
+    pylist = pymod2pkg.module2package(mod, dist or detect_dist(),
+                                      py_vers=pyversions)
+    # When only 1 version is requested, it will be returned as a string,
+    # for backwards compatibility. Else, it will be a list.
+    if type(pylist) is list:
+        return ' '.join(pylist)
+    return pylist
+
+
+def print_explanation(mod, dist):
+    exp = pymod2pkg.explain(mod, dist or detect_dist())
+    if exp.position is None:
+        rule = '%s (default translation)' % exp.rule.__name__
+        position = 'none'
+    else:
+        rule = repr(exp.rule)
+        position = str(exp.position)
+    print('module: %s' % exp.mod)
+    print('dist: %s' % exp.dist)
+    print('rule: %s' % rule)
+    print('position: %s (%d rules scanned)' % (position, exp.scanned))
+    print('packages: %s' % ' '.join(exp.pkgs))
+    print('time: %.1f usec' % (exp.seconds * 1e6))
+
+
+def translate_json(request, dist, pyversions, upstream):
+    """Answer a JSON request of the form {"mod", "dist", "pyver"}
+
+    dist and pyver are optional and default to the command line values,
+    pyver being either a single version or a list of them.
+    """
+    try:
+        request = json.loads(request)
+        mod = request['mod']
+        if request.get('upstream', upstream):
+            return {'mod': mod, 'upstream': pymod2pkg.module2upstream(mod)}
+        dist = request.get('dist') or dist or detect_dist()
+        pyver = request.get('pyver') or pyversions
+        if isinstance(pyver, str):
+            pyver = [pyver]
+        pkgs = pymod2pkg.module2package(mod, dist, py_vers=pyver)
+    except Exception as ex:
+        return {'error': str(ex)}
+    if not isinstance(pkgs, list):
+        pkgs = [pkgs]
+    return {'mod': mod, 'dist': dist, 'pkgs': pkgs}
+
+
+def serve(infile, outfile, dist, pyversions, upstream, lock=None):
+    """Answer one module name or JSON request per input line
+
+    Every answer is written and flushed as soon as its line was read, so
+    the process can be driven interactively through a pipe.
+    """
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        if lock is not None:
+            lock.acquire()
+        try:
+            if line.startswith('{'):
+                answer = json.dumps(translate_json(line, dist, pyversions,
+                                                   upstream))
+            else:
+                answer = translate(line, dist, pyversions, upstream)
+        finally:
+            if lock is not None:
+                lock.release()
+        outfile.write(answer + '\n')
+        outfile.flush()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve_socket(path, dist, pyversions, upstream):
+    """Serve requests on a Unix socket, one connection per client
+
+    A socket left behind by a server which is gone is replaced, the socket
+    of a running one or any other file is not. The socket is removed when
+    the server stops, on SIGINT or SIGTERM. Returns the exit status.
+    """
+    import signal
+    import socket
+    import socketserver
+    import stat
+    import threading
+
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            print('%s exists and is not a socket' % path, file=sys.stderr)
+            return 1
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                print('%s is in use by another server' % path,
+                      file=sys.stderr)
+                return 1
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            serve(io.TextIOWrapper(self.rfile, encoding='utf-8'),
+                  io.TextIOWrapper(self.wfile, encoding='utf-8'),
+                  dist, pyversions, upstream, lock)
+
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    except OSError as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    handler = None
+    if threading.current_thread() is threading.main_thread():
+        handler = signal.signal(signal.SIGTERM, _interrupt)
+    with server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if handler is not None:
+                signal.signal(signal.SIGTERM, handler)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    return 0
 
 
 def main():
@@ -22,27 +165,52 @@ def main():
                                      'package name')
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
-        '--dist', help='distribution style (default: %(default)s)',
-        default=distro.LinuxDistribution().id().partition(' ')[0])
+        '--dist', action='append', default=[],
+        help='distribution style, can be repeated, "all" selects one of '
+        'each supported style (default: the running system)')
     group.add_argument('--upstream', help='map to OpenStack project name',
                        action='store_true')
     parser.add_argument('--pyver', help='Python versions to return. "py" is '
                         'the unversioned name',
                         action='append', choices=['py', 'py2', 'py3'],
                         default=[])
-    parser.add_argument('modulename', help='python module name')
+    parser.add_argument('--explain', action='store_true',
+                        help='show which rule translates the module')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('modulename', nargs='?', help='python module name')
+    mode.add_argument('--stdin', action='store_true',
+                      help='read one module name or JSON request '
+                      '{"mod": ..., "dist": ..., "pyver": ...} per line from '
+                      'stdin and write each answer as soon as it is known')
+    mode.add_argument('--socket', metavar='PATH',
+                      help='like --stdin but serving the clients of a Unix '
+                      'socket created at PATH')
     args = vars(parser.parse_args())
 
     pyversions = args['pyver'] if args['pyver'] else ['py']
+    dists = []
+    for dist in args['dist']:
+        for d in pymod2pkg.all_dists() if dist == 'all' else [dist]:
+            if d not in dists:
+                dists.append(d)
+
+    if len(dists) > 1 and (args['stdin'] or args['socket']):
+        parser.error('--stdin and --socket take a single --dist')
+    dist = dists[0] if dists else None
 
-    if args['upstream']:
-        print(pymod2pkg.module2upstream(args['modulename']))
+    if args['explain'] and args['modulename'] and not args['upstream']:
+        for dist in dists or [None]:
+            print_explanation(args['modulename'], dist)
+    elif args['stdin']:
+        serve(sys.stdin, sys.stdout, dist, pyversions, args['upstream'])
+    elif args['socket']:
+        return serve_socket(args['socket'], dist, pyversions,
+                            args['upstream'])
+    elif len(dists) > 1:
+        matrix = pymod2pkg.module2package_matrix(
+            [args['modulename']], dists, py_vers=pyversions)
+        for dist, pkgs in matrix[args['modulename']].items():
+            print('%s: %s' % (dist, ' '.join(pkgs)))
     else:
-        pylist = pymod2pkg.module2package(args['modulename'], args['dist'],
-                                          py_vers=pyversions)
-        # When only 1 version is requested, it will be returned as a string,
-        # for backwards compatibility. Else, it will be a list.
-        if type(pylist) is list:
-            print(' '.join(pylist))
-        else:
-            print(pylist)
+        print(translate(args['modulename'], dist, pyversions,
+                        args['upstream']))
@@ -10,18 +10,96 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+
 import argparse
-import distro
-import packaging.requirements
+import json
 import pymod2pkg
+from pymod2pkg.cli import detect_dist
+from pymod2pkg.requirements import iter_release
+from pymod2pkg.requirements import iter_requirement_matrix
+from pymod2pkg.requirements import iter_translated_matrix
+from pymod2pkg.requirements import marker_environment
+from pymod2pkg.requirements import ResultCache
 import sys
 
 
 def get_default_prefix(dist):
-    d_lower = dist.lower()
-    if 'ubuntu' in d_lower:
-        return "Depends"
-    return "Requires"
+    return pymod2pkg.dist_profile(dist).prefix
+
+
+def print_packages(reqs, dist, prefix, verbose):
+    # This is slightly complex but it handles the following scenarios:
+    # $ reqs2pkg -r test-requirements.txt --dist ubuntu -b
+    # python-stestr
+    # python-testresources
+    # python-testtools
+    # $ reqs2pkg -r test-requirements.txt --dist ubuntu
+    # Processing: test-requirements.txt
+    # Depends: python-stestr, python-testresources, python-testtools
+    # $ reqs2pkg -r test-requirements.txt --dist rhel -b
+    # python-stestr
+    # python-testresources
+    # python-testtools
+    # $ reqs2pkg -r test-requirements.txt --dist rhel
+    # Processing: test-requirements.txt
+    # Requires: python-stestr
+    # Requires: python-testresources
+    # Requires: python-testtools
+    if verbose:
+        prefix = f"{prefix}: "
+    else:
+        prefix = ''
+    delim = pymod2pkg.dist_profile(dist).delimiter
+    if delim is None:
+        delim = f"\n{prefix}"
+
+    if verbose:
+        print(prefix + delim.join(reqs))
+    else:
+        print("\n".join(reqs))
+    sys.stdout.flush()
+
+
+def print_release(results, dists):
+    """Print the results of iter_release() as NDJSON
+
+    Projects are printed as they come, the inverted index of the packages
+    once all of them are translated.
+    """
+    ret = 0
+    index = dict((dist, {}) for dist in dists)
+    for project, matrix, errors in results:
+        for error in errors:
+            print(error, file=sys.stderr)
+            ret = 1
+        for dist in dists:
+            print(json.dumps({'project': project, 'dist': dist,
+                              'packages': matrix[dist]}))
+            for pkg in matrix[dist]:
+                index[dist].setdefault(pkg, []).append(project)
+        sys.stdout.flush()
+    for dist in dists:
+        for pkg, projects in sorted(index[dist].items()):
+            print(json.dumps({'package': pkg, 'dist': dist,
+                              'projects': projects}))
+    return ret
+
+
+def translate_lines(lines, dists, pyversions, marker_envs, normalize=False,
+                    table=None):
+    """Translate requirement lines like iter_translated_matrix() a file"""
+    source = getattr(lines, 'name', '<lines>')
+    matrix = dict((dist, []) for dist in dists)
+    try:
+        for rec in iter_requirement_matrix(lines, dists, pyversions,
+                                           marker_envs, normalize, table,
+                                           source):
+            for dist in dists:
+                if rec.included[dist]:
+                    matrix[dist].append(rec.packages[dist][0])
+    except (OSError, ValueError) as ex:
+        return [(source, None, str(ex))]
+    return [(source, matrix, None)]
 
 
 def main():
@@ -32,15 +110,56 @@ def main():
                     'distribution packages'
     )
     parser.add_argument(
-        '--dist', help='distribution style (default: %(default)s)',
-        default=distro.LinuxDistribution().id().partition(' ')[0])
+        '--dist', action='append', default=[],
+        help='distribution style, can be repeated, "all" selects one of '
+        'each supported style (default: the running system)')
     parser.add_argument('--pyver', help='Python versions to return. "py" is '
                         'the unversioned name',
                         action='append', choices=['py', 'py2', 'py3'],
                         default=[])
-    parser.add_argument('-r', '--requirements', action="append",
-                        dest='requirements', required=True, default=[],
-                        help="python requirements file to parse")
+    parser.add_argument('--marker-env', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='Override an environment marker variable used '
+                        'to select requirements, e.g. python_version=3.9')
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('-r', '--requirements', action="append",
+                        dest='requirements', default=[],
+                        help="python requirements file to parse, - reads "
+                        "it from stdin")
+    inputs.add_argument('--release', action='append', default=[],
+                        metavar='PATH',
+                        help='Translate every project found in this '
+                        'directory tree or listed in this file, one project '
+                        'directory per line, and output NDJSON: one object '
+                        'per project and dist followed by one per package '
+                        'and dist listing the projects requiring it')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes reading the requirements '
+                        'files in parallel, 0 uses one per CPU '
+                        '(default: %(default)s)')
+    parser.add_argument('--cache-dir',
+                        help='Cache the translated packages of every '
+                        'requirements file in this directory and reuse them '
+                        'while the file, its includes and the rules are '
+                        'unchanged')
+    parser.add_argument('--cache-max-size', type=int, default=64,
+                        metavar='MB',
+                        help='Evict the least recently used entries when the '
+                        'cache grows over this size (default: %(default)s)')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Also match the rules spelling a name '
+                        'differently, e.g. PyYAML for pyyaml or py_yaml')
+    parser.add_argument('--table', metavar='FILE',
+                        help='Mapping table consulted ahead of the rules, '
+                        'see pymod2pkg.table')
+    parser.add_argument('--index', metavar='FILE',
+                        help='Package names of a repository, one per line, '
+                        'see pymod2pkg.resolver. Packages missing from it '
+                        'are replaced by an existing spelling if any, or '
+                        'reported')
+    parser.add_argument('-u', '--union', action='store_true',
+                        help='Output the deduplicated union of the packages '
+                        'required by all the requirements files')
     parser.add_argument('-v', '--verbose', dest='verbose', action='count',
                         default=1, help='Invrease verbosity of the program')
     parser.add_argument('-b', '--brief', dest='verbose', action='store_const',
@@ -50,66 +169,103 @@ def main():
                         "the user or one determined by the --dist value")
 
     args = vars(parser.parse_args())
+    dists = []
+    for dist in args['dist'] or [detect_dist()]:
+        for d in pymod2pkg.all_dists() if dist == 'all' else [dist]:
+            if d not in dists:
+                dists.append(d)
 
     pyversions = args['pyver'] if args['pyver'] else ['py']
     if len(pyversions) > 1:
         print("Please select only one version of python", file=sys.stderr)
         return 1
-    args['prefix'] = get_default_prefix(args['dist'])
+    overrides = dict(o.partition('=')[::2] for o in args['marker_env'])
+    marker_envs = dict((dist, marker_environment(dist, pyversions[0],
+                                                 overrides))
+                       for dist in dists)
+
+    def output(matrix):
+        for dist in dists:
+            if len(dists) > 1:
+                print(f'[{dist}]')
+            print_packages(matrix[dist], dist, get_default_prefix(dist),
+                           args['verbose'])
+
+    table = None
+    if args['table']:
+        from pymod2pkg.table import MappingTable
 
-    for reqs_file in args['requirements']:
-        if args['verbose']:
-            print(f'Processing: {reqs_file}')
         try:
-            with open(reqs_file) as f:
-                reqs_txt = [line.strip() for line in f.readlines()]
-        except FileNotFoundError as ex:
-            print(ex)
-
-        reqs = []
-        for line in reqs_txt:
-            if line.startswith('#') or line == '':
-                continue
-            # TODO(tonyb): Do we need to extend this so that it does the
-            # right thing when given muliple versions of python for example:
-            # requirements,txt":
-            # liba>2;python_version>=3
-            # altlib;python_version<3
-            # We should honor this based on pyversions
-            req = packaging.requirements.Requirement(line.split('#')[0])
-            pkg = pymod2pkg.module2package(req.name, args['dist'],
-                                           py_vers=pyversions)
-            # We can potentially extend this to include versions
-            # specifications.  The exact output will clearly be
-            # distribution specific
-            reqs.append(pkg)
-
-        # This is slightly complex but it handles the following scenarios:
-        # $ reqs2pkg -r test-requirements.txt --dist ubuntu -b
-        # python-stestr
-        # python-testresources
-        # python-testtools
-        # $ reqs2pkg -r test-requirements.txt --dist ubuntu
-        # Processing: test-requirements.txt
-        # Depends: python-stestr, python-testresources, python-testtools
-        # $ reqs2pkg -r test-requirements.txt --dist rhel -b
-        # python-stestr
-        # python-testresources
-        # python-testtools
-        # $ reqs2pkg -r test-requirements.txt --dist rhel
-        # Processing: test-requirements.txt
-        # Requires: python-stestr
-        # Requires: python-testresources
-        # Requires: python-testtools
-        prefix = ''
-        if args['verbose']:
-            prefix = f"{args['prefix']}: "
-        if args['dist'].lower() in 'ubuntu':
-            delim = ", "
-        else:
-            delim = f"\n{prefix}"
+            table = MappingTable(args['table'])
+        except (OSError, ValueError) as ex:
+            print(ex, file=sys.stderr)
+            return 1
+
+    index = None
+    if args['index']:
+        from pymod2pkg import resolver
+
+        try:
+            index = resolver.PackageIndex.load(args['index'])
+        except OSError as ex:
+            print(ex, file=sys.stderr)
+            return 1
 
+    def resolve(name, matrix):
+        if index is None:
+            return matrix
+        resolved = {}
+        for dist, pkgs in matrix.items():
+            resolved[dist] = []
+            for pkg in pkgs:
+                pkg, confidence = resolver.resolve_package(
+                    pkg, index, dist)
+                if confidence == resolver.MISSING:
+                    print(f'{name}: {pkg} not found in {args["index"]}',
+                          file=sys.stderr)
+                resolved[dist].append(pkg)
+        return resolved
+
+    cache = None
+    if args['cache_dir']:
+        cache = ResultCache(args['cache_dir'],
+                            args['cache_max_size'] * 1024 * 1024)
+
+    if args['release']:
+        results = iter_release(args['release'], dists, pyversions,
+                               args['jobs'], marker_envs, cache,
+                               args['normalize'], table)
+        return print_release(((project, resolve(project, matrix), errors)
+                              for project, matrix, errors in results),
+                             dists)
+
+    if args['requirements'] == ['-']:
+        results = translate_lines(sys.stdin, dists, pyversions, marker_envs,
+                                  args['normalize'], table)
+    elif '-' in args['requirements']:
+        print("- can't be combined with other requirements files",
+              file=sys.stderr)
+        return 1
+    else:
+        results = iter_translated_matrix(
+            args['requirements'], dists, pyversions, args['jobs'],
+            marker_envs, cache, normalize=args['normalize'], table=table)
+
+    ret = 0
+    union = dict((dist, {}) for dist in dists)
+    for reqs_file, matrix, error in results:
         if args['verbose']:
-            print(prefix + delim.join(reqs))
-        else:
-            print("\n".join(reqs))
+            print(f'Processing: {reqs_file}')
+        if error is not None:
+            print(error, file=sys.stderr)
+            ret = 1
+            continue
+        matrix = resolve(reqs_file, matrix)
+        if args['union']:
+            for dist in dists:
+                union[dist].update(dict.fromkeys(matrix[dist]))
+            continue
+        output(matrix)
+    if args['union']:
+        output(dict((dist, list(reqs)) for dist, reqs in union.items()))
+    return ret
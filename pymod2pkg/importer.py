@@ -0,0 +1,314 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Mapping tables from repository metadata
+
+Reads local repository metadata and writes the python module to package
+mapping it contains as a mapping table, see pymod2pkg.table:
+
+    python -m pymod2pkg.importer -o OUTPUT METADATA...
+
+RPM repositories are read from primary.xml or primary.sqlite and their
+python3dist()/python2dist() provides, Debian ones from Packages or Sources
+files, the source package name without its python prefix being taken for
+the module name of the python binary packages. Files may be compressed
+with gzip, bzip2 or xz. Metadata is streamed, memory use only grows with
+the number of modules.
+
+With --names, the names of all the packages are written instead, one per
+line, for pymod2pkg.resolver.PackageIndex.
+"""
+
+import argparse
+import bz2
+import contextlib
+import gzip
+import lzma
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+from pymod2pkg import table
+
+_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+_PYTHON_DIST = re.compile(r'^python(\d?)dist\((?P<name>[^)]+)\)$')
+_DEB_PYTHON = re.compile(r'^python(\d?)-')
+_VERSION_INDEX = {'': 0, '2': 1, '3': 2}
+
+
+def open_metadata(path, mode='rb', encoding=None):
+    """Open a possibly compressed metadata file"""
+    opener = _OPENERS.get(os.path.splitext(path)[1], open)
+    return opener(path, mode, encoding=encoding)
+
+
+def metadata_format(path):
+    """Guess the format of a metadata file from its name"""
+    name = os.path.basename(path)
+    for suffix in _OPENERS:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith('.sqlite'):
+        return 'rpm-sqlite'
+    if name.endswith('.xml'):
+        return 'rpm-xml'
+    if name == 'Sources':
+        return 'deb-sources'
+    if name == 'Packages':
+        return 'deb-packages'
+    raise ValueError('Unknown metadata format: %s' % path)
+
+
+def _python_dist(provide):
+    match = _PYTHON_DIST.match(provide)
+    if match and match.group(1) in _VERSION_INDEX:
+        return match.group('name'), _VERSION_INDEX[match.group(1)]
+    return None
+
+
+def _iter_rpm_packages(path):
+    # yields (name, provides) per package
+    with open_metadata(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        name = None
+        provides = []
+        in_provides = False
+        for event, elem in context:
+            tag = elem.tag.rpartition('}')[2]
+            if tag == 'provides':
+                # requires entries name python3dist() too
+                in_provides = event == 'start'
+            if event != 'end':
+                continue
+            if tag == 'name' and name is None:
+                name = elem.text
+            elif tag == 'entry' and in_provides:
+                provides.append(elem.get('name', ''))
+            elif tag == 'package':
+                if name is not None:
+                    yield (name, provides)
+                name = None
+                provides = []
+                # drop the parsed packages, memory stays constant
+                root.clear()
+
+
+def iter_rpm_xml(path):
+    """Yield (module, version index, package) from a primary.xml file"""
+    for name, provides in _iter_rpm_packages(path):
+        for provide in provides:
+            dist = _python_dist(provide)
+            if dist:
+                yield (dist[0], dist[1], name)
+
+
+@contextlib.contextmanager
+def _sqlite(path):
+    with contextlib.ExitStack() as stack:
+        if os.path.splitext(path)[1] in _OPENERS:
+            # sqlite needs a plain file, decompress it in chunks
+            tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+            plain = os.path.join(tmpdir, 'primary.sqlite')
+            with open_metadata(path) as src, open(plain, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            path = plain
+        conn = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        stack.callback(conn.close)
+        yield conn
+
+
+def iter_rpm_sqlite(path):
+    """Yield (module, version index, package) from a primary.sqlite file"""
+    with _sqlite(path) as conn:
+        rows = conn.execute(
+            "SELECT provides.name, packages.name FROM provides "
+            "JOIN packages USING (pkgKey) "
+            "WHERE provides.name LIKE 'python%dist(%'")
+        for provide, name in rows:
+            dist = _python_dist(provide)
+            if dist:
+                yield (dist[0], dist[1], name)
+
+
+def _iter_stanzas(path):
+    fields = {}
+    key = None
+    # Debian control files are UTF-8 whatever the locale
+    with open_metadata(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip():
+                if fields:
+                    yield fields
+                fields = {}
+                key = None
+            elif line[0] in ' \t':
+                if key is not None:
+                    fields[key] += ' ' + line.strip()
+            else:
+                key, _, value = line.partition(':')
+                key = key.lower()
+                fields[key] = value.strip()
+    if fields:
+        yield fields
+
+
+def _deb_python(package):
+    match = _DEB_PYTHON.match(package)
+    if match and match.group(1) in _VERSION_INDEX:
+        return _VERSION_INDEX[match.group(1)]
+    return None
+
+
+def _deb_module(source):
+    # python-babel builds python3-babel, the module is babel
+    match = _DEB_PYTHON.match(source)
+    return source[match.end():] if match else source
+
+
+def iter_deb_packages(path):
+    """Yield (module, version index, package) from a Packages file"""
+    for fields in _iter_stanzas(path):
+        package = fields.get('package', '')
+        version = _deb_python(package)
+        if version is None:
+            continue
+        # Source may carry a version: "pyyaml (5.4.1-1)", and is omitted
+        # when it is the name of the package
+        source = fields.get('source', package).split()[0]
+        yield (_deb_module(source), version, package)
+
+
+def iter_deb_sources(path):
+    """Yield (module, version index, package) from a Sources file"""
+    for fields in _iter_stanzas(path):
+        source = fields.get('package', '')
+        if not source:
+            continue
+        for package in fields.get('binary', '').split(','):
+            package = package.strip()
+            version = _deb_python(package)
+            if version is not None:
+                yield (_deb_module(source), version, package)
+
+
+READERS = {
+    'rpm-xml': iter_rpm_xml,
+    'rpm-sqlite': iter_rpm_sqlite,
+    'deb-packages': iter_deb_packages,
+    'deb-sources': iter_deb_sources,
+}
+
+
+def iter_package_names(path, fmt=None):
+    """Yield the names of all the packages of a metadata file
+
+    fmt: one of READERS, guessed from the file name by default
+    """
+    fmt = fmt or metadata_format(path)
+    if fmt == 'rpm-xml':
+        for name, _ in _iter_rpm_packages(path):
+            yield name
+    elif fmt == 'rpm-sqlite':
+        with _sqlite(path) as conn:
+            for name, in conn.execute("SELECT name FROM packages"):
+                yield name
+    elif fmt == 'deb-packages':
+        for fields in _iter_stanzas(path):
+            if fields.get('package'):
+                yield fields['package']
+    else:
+        for fields in _iter_stanzas(path):
+            for package in fields.get('binary', '').split(','):
+                if package.strip():
+                    yield package.strip()
+
+
+def collect_entries(records):
+    """Merge (module, version index, package) records into table entries
+
+    When several packages provide a module for the same python version,
+    the shortest name wins, e.g. python3-foo over python3.11-foo. The
+    unversioned package is the python3 one, or the python2 one for modules
+    only packaged for python2.
+    """
+    modules = {}
+    for mod, version, package in records:
+        pkgs = modules.setdefault(mod, [None, None, None])
+        current = pkgs[version]
+        if current is None or (len(package), package) < (len(current),
+                                                         current):
+            pkgs[version] = package
+    for mod in sorted(modules):
+        pkg, py2pkg, py3pkg = modules[mod]
+        pkg = pkg or py3pkg or py2pkg
+        yield (mod, (pkg, py2pkg or pkg, py3pkg or pkg))
+
+
+def import_metadata(paths, output, fmt=None):
+    """Write the mapping table of the metadata files at paths to output
+
+    fmt: one of READERS, guessed from the file names by default
+    """
+    def records():
+        for path in paths:
+            yield from READERS[fmt or metadata_format(path)](path)
+
+    return table.build_table(collect_entries(records()), output,
+                             normalize=True)
+
+
+def import_package_names(paths, output, fmt=None):
+    """Write the sorted package names of the metadata files at paths"""
+    names = set()
+    for path in paths:
+        names.update(iter_package_names(path, fmt))
+    tmp = '%s.%d.tmp' % (output, os.getpid())
+    with open(tmp, 'w') as f:
+        for name in sorted(names):
+            f.write(name + '\n')
+    os.replace(tmp, output)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build a mapping table from repository metadata')
+    parser.add_argument('--names', action='store_true',
+                        help='write the names of all the packages instead, '
+                        'one per line')
+    parser.add_argument('--format', choices=sorted(READERS),
+                        help='metadata format (default: guessed from the '
+                        'file names)')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the table file to write')
+    parser.add_argument('metadata', nargs='+',
+                        help='primary.xml, primary.sqlite, Packages or '
+                        'Sources file')
+    args = parser.parse_args(argv)
+    write = import_package_names if args.names else import_metadata
+    try:
+        write(args.metadata, args.output, args.format)
+    except (OSError, ValueError, ET.ParseError, sqlite3.Error) as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    print('Wrote %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,680 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+"""Translating requirements files
+
+The library behind reqs2pkg: parsing requirements files with their
+includes and environment markers, and translating the requirements they
+list to packages, one line, file or release project at a time.
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import pymod2pkg
+
+
+def marker_environment(dist, pyversion, overrides=None):
+    """Return the environment requirement markers are evaluated against
+
+    It describes the python of the given distribution style: a Linux
+    system running python 2.7 for 'py2', the python version found in the
+    dist name (e.g. 3.11 for suse_py311) if any and the running python
+    otherwise.
+
+    overrides: a dict of marker variables taking precedence
+    """
+    import packaging.markers
+
+    env = packaging.markers.default_environment()
+    env.update(os_name='posix', sys_platform='linux',
+               platform_system='Linux')
+    python = None
+    match = re.search(r'py(3)(\d+)$', dist.lower())
+    if pyversion == 'py2':
+        python = '2.7'
+    elif match:
+        python = '%s.%s' % match.groups()
+    if python and python != env['python_version']:
+        env['python_version'] = python
+        env['python_full_version'] = python + '.0'
+    env.update(overrides or {})
+    return env
+
+
+def parse_include(line):
+    """Return the file referenced by a -r/--requirement line or None
+
+    Constraints files (-c/--constraint) only restrict versions of
+    requirements listed elsewhere, so they are recognized but not followed.
+    """
+    for short, long in (('-r', '--requirement'), ('-c', '--constraint')):
+        for opt in (long + '=', long, short):
+            if line.startswith(opt):
+                path = line[len(opt):].strip()
+                return path if short == '-r' else ''
+    return None
+
+
+_NAME = r'[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?'
+_VERSION = r'\d+(?:\.\d+)*(?:(?:a|b|rc)\d+)?(?:\.post\d+)?(?:\.dev\d+)?'
+_SPEC = (r'(?:[=!]=\s*%(v)s(?:\.\*)?|(?:>=|<=|>|<)\s*%(v)s'
+         r'|~=\s*\d+(?:\.\d+)+)' % {'v': _VERSION})
+# name[extras]<specs>;marker with plain PEP 440 versions, which is what
+# nearly every requirements file uses. Anything else goes to packaging.
+_FAST_REQUIREMENT = re.compile(
+    r'(?P<name>%(name)s)\s*'
+    r'(?:\[\s*(?:%(name)s(?:\s*,\s*%(name)s)*)?\s*\]\s*)?'
+    r'(?:%(spec)s(?:\s*,\s*%(spec)s)*\s*)?'
+    r'(?:;\s*(?P<marker>\S.*))?$' % {'name': _NAME, 'spec': _SPEC})
+# pip options (-e, --index-url, ...), URLs and local paths
+_SKIPPED = re.compile(r'[-./~]|[A-Za-z][A-Za-z0-9+.-]*:')
+_MARKERS = {}
+
+
+def _normalize_marker(marker):
+    try:
+        return _MARKERS[marker]
+    except KeyError:
+        import packaging.markers
+
+        # raises InvalidMarker just like Requirement would
+        normalized = _MARKERS[marker] = str(packaging.markers.Marker(marker))
+        return normalized
+
+
+def parse_requirement(line):
+    """Return the (name, marker) of a requirement line, None if skipped
+
+    line: a requirement without its comment and surrounding whitespace
+
+    Common requirements are parsed with a regular expression, the others by
+    packaging. Editable installs, URLs, local paths and other pip options
+    are skipped. Raises InvalidRequirement for invalid requirements.
+    """
+    match = _FAST_REQUIREMENT.match(line)
+    if match:
+        marker = match.group('marker')
+        if marker is not None:
+            marker = _normalize_marker(marker.rstrip())
+        return (match.group('name'), marker)
+    if _SKIPPED.match(line):
+        return None
+    import packaging.requirements
+
+    req = packaging.requirements.Requirement(line)
+    return (req.name, str(req.marker) if req.marker else None)
+
+
+def _iter_entries(lines, source, base):
+    for lineno, text in enumerate(lines, 1):
+        line = text.split('#')[0].strip()
+        if line == '':
+            continue
+        include = parse_include(line)
+        if include is not None:
+            if include:
+                include = os.path.normpath(os.path.join(base, include))
+                yield (True, include, None, lineno, text.rstrip('\n'))
+            continue
+        try:
+            req = parse_requirement(line)
+        except ValueError as ex:
+            # InvalidRequirement and InvalidMarker
+            raise ValueError('%s:%d: %s' % (source, lineno, ex))
+        if req is not None:
+            yield (False, req[0], req[1], lineno, text.rstrip('\n'))
+
+
+def parse_requirements(reqs_file):
+    """Parse a requirements file without following its includes
+
+    Returns a (reqs_file, entries, error) tuple. entries is a list of
+    (is_include, value, marker, lineno, line) tuples in file order, value
+    being a requirement name or the path of an included requirements file,
+    marker the requirement's environment marker or None and line the text
+    of the line. error is a message describing why the file couldn't be
+    parsed, entries is None in that case.
+    """
+    try:
+        with open(reqs_file) as f:
+            entries = list(_iter_entries(f, reqs_file,
+                                         os.path.dirname(reqs_file)))
+    except (OSError, ValueError) as ex:
+        return (reqs_file, None, str(ex))
+    return (reqs_file, entries, None)
+
+
+class ParsedFiles(object):
+    """
+    Parse requirements files at most once per run
+
+    With an executor, files are parsed in worker processes and the files
+    they include are queued for parsing as soon as they are known. With
+    max_parsed, only that many of the most recently used files are kept.
+    With stream, walk() reads the files lazily instead, keeping none.
+    """
+    def __init__(self, executor=None, max_parsed=None, stream=False):
+        self.executor = executor
+        self.max_parsed = max_parsed
+        self.stream = stream
+        self.parsed = collections.OrderedDict()
+        self.pending = {}
+
+    def prefetch(self, reqs_file):
+        if (self.executor is not None and reqs_file not in self.parsed
+                and reqs_file not in self.pending):
+            self.pending[reqs_file] = self.executor.submit(
+                parse_requirements, reqs_file)
+
+    def get(self, reqs_file):
+        try:
+            self.parsed.move_to_end(reqs_file)
+            return self.parsed[reqs_file]
+        except KeyError:
+            pass
+        future = self.pending.pop(reqs_file, None)
+        if future is not None:
+            result = future.result()
+        else:
+            result = parse_requirements(reqs_file)
+        self.parsed[reqs_file] = result
+        if (self.max_parsed is not None
+                and len(self.parsed) > self.max_parsed):
+            self.parsed.popitem(last=False)
+        for entry in result[1] or []:
+            if entry[0]:
+                self.prefetch(entry[1])
+        return result
+
+    def _entries(self, reqs_file):
+        if not self.stream:
+            _, entries, error = self.get(reqs_file)
+            if error is not None:
+                raise ValueError(error)
+            yield from entries
+            return
+        try:
+            f = open(reqs_file)
+        except OSError as ex:
+            raise ValueError(str(ex))
+        with f:
+            yield from _iter_entries(f, reqs_file,
+                                     os.path.dirname(reqs_file))
+
+    def walk(self, reqs_file, lines=None, files=None):
+        """Yield the requirements of reqs_file and its includes in order
+
+        Yields a (source, lineno, line, name, marker) tuple per requirement,
+        source being the file it comes from. Every file is expanded once
+        and a ValueError is raised for an include cycle or a file which
+        couldn't be parsed.
+
+        lines: the lines of reqs_file, read lazily instead of the file,
+               their includes being relative to the current directory
+        files: a list the expanded files are appended to
+        """
+        seen = {}
+        stack = []
+
+        def expand(path, entries):
+            seen[path] = None
+            if files is not None:
+                files.append(path)
+            stack.append(path)
+            for is_include, value, marker, lineno, line in entries:
+                if not is_include:
+                    yield (path, lineno, line, value, marker)
+                elif value in stack:
+                    raise ValueError('Include cycle: %s' % ' -> '.join(
+                        stack[stack.index(value):] + [value]))
+                elif value not in seen:
+                    yield from expand(value, self._entries(value))
+            stack.pop()
+
+        if lines is not None:
+            yield from expand(reqs_file,
+                              _iter_entries(lines, reqs_file, os.curdir))
+            return
+        reqs_file = os.path.normpath(reqs_file)
+        yield from expand(reqs_file, self._entries(reqs_file))
+
+    def names(self, reqs_file):
+        """Return the requirements of reqs_file and its includes
+
+        Returns a (requirements, files, error) tuple, requirements being a
+        list of (name, marker) pairs and files the list of the files they
+        come from, see walk().
+        """
+        files = []
+        try:
+            names = [(name, marker) for _, _, _, name, marker
+                     in self.walk(reqs_file, files=files)]
+        except ValueError as ex:
+            return (None, None, str(ex))
+        return (names, files, None)
+
+
+class _Translator(object):
+    # translates requirements for dists, evaluating every marker once
+    def __init__(self, marker_envs, py_vers, normalize=False, table=None):
+        self.marker_envs = marker_envs
+        self.py_vers = py_vers
+        self.normalize = normalize
+        self.table = table
+        self.markers = {}
+
+    def included(self, marker, dist):
+        if marker is None:
+            return True
+        try:
+            return self.markers[marker, dist]
+        except KeyError:
+            import packaging.markers
+
+            result = packaging.markers.Marker(marker).evaluate(
+                self.marker_envs[dist])
+            self.markers[marker, dist] = result
+            return result
+
+    def packages(self, name, dist):
+        return pymod2pkg.module2package(name, dist, py_vers=self.py_vers,
+                                        normalize=self.normalize,
+                                        table=self.table)
+
+
+class ResultCache(object):
+    """
+    On-disk cache of translated requirements files
+
+    Entries are keyed by the path and content of a requirements file, the
+    dist, the python versions, the marker environment and the version of
+    the code and rules, and remember the content of the files it includes,
+    so an unchanged file is translated without parsing it. Entries are
+    written atomically and can be shared by concurrent runs. The least
+    recently used entries are evicted when the cache grows over max_size
+    bytes.
+    """
+    def __init__(self, cache_dir, max_size=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.rule_versions = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _hash_file(path):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def rules_version(self, dist):
+        """Return a hash of the code and rules translating for dist"""
+        try:
+            return self.rule_versions[dist]
+        except KeyError:
+            pass
+        profile = pymod2pkg.dist_profile(dist)
+        digest = hashlib.sha256()
+        # the translation code as well as the parsing and marker code
+        for module in (pymod2pkg.__file__, __file__):
+            with open(module, 'rb') as f:
+                digest.update(f.read())
+        digest.update(pymod2pkg.rule_map_digest(profile.pkg_map).encode())
+        digest.update(repr([profile.name, profile.default_tr.__module__,
+                            profile.default_tr.__qualname__]).encode())
+        version = self.rule_versions[dist] = digest.hexdigest()
+        return version
+
+    def _path(self, reqs_file, dist, pyversions, marker_env, options):
+        content = self._hash_file(reqs_file)
+        if content is None:
+            return None
+        # includes are relative to the file, so is the result
+        key = json.dumps([os.path.abspath(reqs_file), content, dist,
+                          list(pyversions),
+                          sorted(marker_env.items()), list(options),
+                          self.rules_version(dist)])
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + '.json')
+
+    def get(self, reqs_file, dist, pyversions, marker_env, options=()):
+        """Return the cached packages of reqs_file or None
+
+        options: anything else the translation depends on, JSON serializable
+        """
+        path = self._path(reqs_file, dist, pyversions, marker_env, options)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for include, content in entry['includes']:
+            if self._hash_file(include) != content:
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['packages']
+
+    def put(self, reqs_file, files, dist, pyversions, marker_env, packages,
+            options=()):
+        """Store the packages of reqs_file, files being its include closure"""
+        path = self._path(reqs_file, dist, pyversions, marker_env, options)
+        if path is None:
+            return
+        includes = [[f, self._hash_file(f)] for f in files
+                    if f != os.path.normpath(reqs_file)]
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'includes': includes, 'packages': packages}, f)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used entries over max_size"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+
+RequirementPackages = collections.namedtuple(
+    'RequirementPackages', ['source', 'lineno', 'line', 'name', 'marker',
+                            'included', 'packages'])
+
+
+def iter_requirement_packages(lines_or_path, dist, py_vers=('py',),
+                              marker_env=None, normalize=False, table=None,
+                              source=None):
+    """Translate requirements one line at a time
+
+    lines_or_path: the path of a requirements file or any iterable of its
+                   lines, e.g. a list, an open file or sys.stdin
+    dist: a linux distribution, see pymod2pkg.module2package()
+    py_vers: the python versions to translate to, see
+             pymod2pkg.module2package()
+    marker_env: the environment markers are evaluated against, defaults to
+                marker_environment(dist, py_vers[0])
+    normalize, table: see pymod2pkg.module2package()
+    source: the name of the lines in the records and errors, defaults to
+            the path or the name of the file object
+
+    Lazily yields a RequirementPackages record per requirement: the file
+    it comes from, its line number and text, the requirement name and
+    marker, whether the marker matches marker_env and the tuple of the
+    packages, one per python version, or None when it doesn't match.
+    Files are read as the records are consumed. Included files (-r) are
+    followed once, relative to the including file or to the current
+    directory for lines, as iter_translated() does. Raises ValueError for
+    invalid or unreadable files and include cycles.
+    """
+    marker_envs = {dist: marker_env} if marker_env is not None else None
+    for rec in iter_requirement_matrix(lines_or_path, [dist], py_vers,
+                                       marker_envs, normalize, table,
+                                       source):
+        yield rec._replace(included=rec.included[dist],
+                           packages=rec.packages[dist])
+
+
+def iter_requirement_matrix(lines_or_path, dists, py_vers=('py',),
+                            marker_envs=None, normalize=False, table=None,
+                            source=None):
+    """Translate requirements one line at a time for several dists
+
+    Like iter_requirement_packages() but the lines are read once for all
+    the dists and included and packages are dicts mapping each dist to
+    its value.
+
+    marker_envs: a dict mapping dists to the environment markers are
+                 evaluated against, see iter_requirement_packages()
+    """
+    py_vers = tuple(py_vers)
+    marker_envs = dict(marker_envs or {})
+    for dist in dists:
+        if marker_envs.get(dist) is None:
+            marker_envs[dist] = marker_environment(dist, py_vers[0])
+    translator = _Translator(marker_envs, py_vers, normalize, table)
+    parsed = ParsedFiles(stream=True)
+    if isinstance(lines_or_path, (str, os.PathLike)):
+        path = os.path.normpath(lines_or_path)
+        records = parsed.walk(path)
+    else:
+        path = source or getattr(lines_or_path, 'name', '<lines>')
+        records = parsed.walk(path, lines_or_path)
+    for rec_source, lineno, line, name, marker in records:
+        included = {}
+        packages = {}
+        for dist in dists:
+            included[dist] = translator.included(marker, dist)
+            packages[dist] = None
+            if included[dist]:
+                pkgs = translator.packages(name, dist)
+                if isinstance(pkgs, str):
+                    pkgs = (pkgs,)
+                packages[dist] = tuple(pkgs)
+        if source is not None and rec_source == path:
+            rec_source = source
+        yield RequirementPackages(rec_source, lineno, line, name, marker,
+                                  included, packages)
+
+
+def iter_translated(reqs_files, dist, pyversions, jobs=1, marker_env=None,
+                    normalize=False, table=None):
+    """Translate requirements files, following their includes
+
+    Yields a (reqs_file, packages, error) tuple per file in the order of
+    reqs_files, see parse_requirements() for the meaning of error. One bad
+    file doesn't abort the processing of the others. Requirements whose
+    marker doesn't match marker_env are skipped.
+
+    jobs: number of worker processes parsing the files, 1 parses them in
+          this process and 0 uses one worker per CPU
+    marker_env: the environment markers are evaluated against, defaults to
+                marker_environment(dist, pyversions[0])
+    normalize: match the rules spelling the names differently, see
+               pymod2pkg.module2package()
+    table: a mapping table consulted ahead of the rules, see
+           pymod2pkg.module2package()
+    """
+    marker_envs = {dist: marker_env} if marker_env is not None else None
+    for reqs_file, matrix, error in iter_translated_matrix(
+            reqs_files, [dist], pyversions, jobs, marker_envs,
+            normalize=normalize, table=table):
+        yield (reqs_file, matrix and matrix[dist], error)
+
+
+def iter_translated_matrix(reqs_files, dists, pyversions, jobs=1,
+                           marker_envs=None, cache=None, window=None,
+                           normalize=False, table=None):
+    """Translate requirements files for several dists at once
+
+    Like iter_translated() but the packages are a dict mapping each dist
+    to its list of packages. Every file is parsed once for all the dists.
+
+    marker_envs: a dict mapping dists to the environment markers are
+                 evaluated against, see iter_translated()
+    cache: a ResultCache the results are taken from and stored in
+    window: read at most that many files ahead of the one being translated
+            and keep at most that many parsed files, so that an iterator
+            of reqs_files is consumed lazily in bounded memory. By default
+            all the files are queued for parsing first.
+    normalize, table: see iter_translated()
+    """
+    marker_envs = dict(marker_envs or {})
+    for dist in dists:
+        if marker_envs.get(dist) is None:
+            marker_envs[dist] = marker_environment(dist, pyversions[0])
+    translator = _Translator(marker_envs, pyversions, normalize, table)
+
+    with contextlib.ExitStack() as stack:
+        executor = None
+        if jobs != 1:
+            import concurrent.futures
+
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(jobs or None))
+        parsed = ParsedFiles(executor, window)
+        options = [normalize, table.digest if table is not None else None]
+
+        def translate(reqs_file, cached):
+            if cached is not None:
+                return (reqs_file, cached, None)
+            names, files, error = parsed.names(reqs_file)
+            if error is not None:
+                return (reqs_file, None, error)
+            # We can potentially extend this to include versions
+            # specifications.  The exact output will clearly be
+            # distribution specific
+            matrix = {}
+            for dist in dists:
+                matrix[dist] = [translator.packages(name, dist)
+                                for name, marker in names
+                                if translator.included(marker, dist)]
+                if cache is not None:
+                    cache.put(reqs_file, files, dist, pyversions,
+                              marker_envs[dist], matrix[dist], options)
+            return (reqs_file, matrix, None)
+
+        queue = collections.deque()
+        for reqs_file in reqs_files:
+            matrix = None
+            if cache is not None:
+                matrix = {}
+                for dist in dists:
+                    matrix[dist] = cache.get(reqs_file, dist, pyversions,
+                                             marker_envs[dist], options)
+                if None in matrix.values():
+                    matrix = None
+            if matrix is None:
+                parsed.prefetch(os.path.normpath(reqs_file))
+            queue.append((reqs_file, matrix))
+            if window is not None and len(queue) > window:
+                yield translate(*queue.popleft())
+        while queue:
+            yield translate(*queue.popleft())
+        if cache is not None:
+            cache.evict()
+
+
+PROJECT_FILES = ('requirements.txt', 'test-requirements.txt',
+                 'doc/requirements.txt')
+
+
+def iter_projects(path):
+    """Find the projects of a release
+
+    path is either a directory searched for projects, i.e. directories
+    holding a requirements.txt or test-requirements.txt file, or a file
+    listing one project directory per line, relative to the file.
+
+    Yields a (project, reqs_files) tuple per project found.
+    """
+    if not os.path.isdir(path):
+        base = os.path.dirname(path)
+        with open(path) as f:
+            for line in f:
+                project = line.split('#', 1)[0].strip()
+                if not project:
+                    continue
+                project_dir = os.path.join(base, project)
+                reqs_files = [os.path.join(project_dir, name)
+                              for name in PROJECT_FILES
+                              if os.path.isfile(os.path.join(project_dir,
+                                                             name))]
+                # report a project without requirements as a missing file
+                yield (project, reqs_files or [
+                    os.path.join(project_dir, PROJECT_FILES[0])])
+        return
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        if not set(PROJECT_FILES[:2]).intersection(files):
+            continue
+        dirs[:] = []
+        project = os.path.relpath(root, path)
+        if project == os.curdir:
+            project = os.path.basename(os.path.abspath(path))
+        yield (project, [os.path.join(root, name) for name in PROJECT_FILES
+                         if os.path.isfile(os.path.join(root, name))])
+
+
+def iter_release(paths, dists, pyversions, jobs=1, marker_envs=None,
+                 cache=None, normalize=False, table=None):
+    """Translate the requirements of every project of a release
+
+    paths are searched for projects with iter_projects(). Yields a
+    (project, matrix, errors) tuple per project as soon as it is
+    translated, matrix mapping each dist to the deduplicated packages of
+    all the requirements files of the project and errors being the list
+    of the errors met reading them. The projects are streamed, memory use
+    doesn't grow with their number.
+    """
+    owners = collections.deque()
+
+    def iter_files():
+        for path in paths:
+            for project, reqs_files in iter_projects(path):
+                owners.append((project, len(reqs_files)))
+                yield from reqs_files
+
+    window = 4 * (jobs or os.cpu_count() or 1)
+    matrix = dict((dist, {}) for dist in dists)
+    errors = []
+    count = 0
+    for _, packages, error in iter_translated_matrix(
+            iter_files(), dists, pyversions, jobs, marker_envs, cache,
+            window, normalize, table):
+        if error is not None:
+            errors.append(error)
+        else:
+            for dist in dists:
+                matrix[dist].update(dict.fromkeys(packages[dist]))
+        count += 1
+        project, nfiles = owners[0]
+        if count == nfiles:
+            owners.popleft()
+            yield (project,
+                   dict((dist, list(pkgs)) for dist, pkgs in matrix.items()),
+                   errors)
+            matrix = dict((dist, {}) for dist in dists)
+            errors = []
+            count = 0
@@ -0,0 +1,128 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Repository-aware package resolution
+
+The rules and default translations guess package names without knowing
+whether they exist. A PackageIndex holds the package names of a repository
+snapshot, written by `python -m pymod2pkg.importer --names`, and resolve()
+checks the guess against it, trying other spellings of the guess when it
+doesn't exist.
+"""
+
+import collections
+import re
+
+import pymod2pkg
+
+EXACT = 'exact'
+CANDIDATE = 'candidate'
+MISSING = 'missing'
+
+Resolution = collections.namedtuple(
+    'Resolution', ['mod', 'dist', 'pkg', 'guess', 'confidence'])
+
+_PREFIX = re.compile(r'^(python\d*-)?(.*)$')
+_PREFIXES = ('python3-', 'python-', 'python2-')
+
+
+class PackageIndex(object):
+    """
+    The package names of a repository
+
+    names: an iterable of package names
+    """
+    def __init__(self, names):
+        self.names = frozenset(names)
+
+    def __repr__(self):
+        return 'PackageIndex(%d names)' % len(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, pkg):
+        return pkg in self.names
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written with one package name per line"""
+        with open(path) as f:
+            return cls(line.strip() for line in f if line.strip())
+
+
+def _dist_prefixes(dist):
+    # the python prefixes of the default translation, python3 first
+    probe = 'probe'
+    pkg, py2pkg, py3pkg = pymod2pkg.dist_profile(dist).default_tr(probe)
+    prefixes = []
+    for name in (py3pkg, pkg, py2pkg):
+        prefix = name[:-len(probe)]
+        if name.endswith(probe) and prefix not in prefixes:
+            prefixes.append(prefix)
+    return prefixes
+
+
+def candidates(pkg, dist=None):
+    """Return the spellings of a package name to try, best first
+
+    The name itself, then in lower case, with '_' and '.' turned into '-'
+    or '-' into '_', then with '-' and '_' turned into '.', each with its
+    own python prefix first and the other python prefixes next. Those are
+    the prefixes of the default translation of dist, python3-, python- and
+    python2- without a dist.
+    """
+    prefix, rest = _PREFIX.match(pkg).groups()
+    prefix = prefix or ''
+    spellings = [rest, rest.lower()]
+    for s in (rest, rest.lower()):
+        spellings.append(re.sub(r'[_.]', '-', s))
+        spellings.append(s.replace('-', '_'))
+    for s in (rest, rest.lower()):
+        spellings.append(re.sub(r'[-_]', '.', s))
+    others = _dist_prefixes(dist) if dist else _PREFIXES
+    prefixes = [prefix] + [p for p in others if p != prefix]
+    names = [pkg]
+    for p in prefixes:
+        for s in spellings:
+            name = p + s
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def resolve_package(pkg, index, dist=None):
+    """Return the first existing spelling of pkg and its confidence
+
+    Returns a (pkg, confidence) tuple, confidence being EXACT when pkg
+    exists, CANDIDATE when another spelling does, see candidates(), and
+    MISSING, with pkg itself, when none does.
+    """
+    if pkg in index:
+        return (pkg, EXACT)
+    for name in candidates(pkg, dist)[1:]:
+        if name in index:
+            return (name, CANDIDATE)
+    return (pkg, MISSING)
+
+
+def resolve(mod, dist, index, py_ver='py', pkg_map=None, **kwargs):
+    """Translate a python module to a package existing in index
+
+    The package module2package() returns is checked against index, see
+    resolve_package(). Extra arguments are passed to module2package().
+    Returns a Resolution.
+    """
+    guess = pymod2pkg.module2package(mod, dist, pkg_map, py_vers=(py_ver,),
+                                     **kwargs)
+    pkg, confidence = resolve_package(guess, index, dist)
+    return Resolution(mod, dist, pkg, guess, confidence)
@@ -0,0 +1,200 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""External mapping tables
+
+A mapping table translates python module names to packages like a map of
+SingleRules, but lives in a compact file holding a hash index over the
+entries, which is memory-mapped read-only and shared by every process using
+it, so tables with tens of thousands of entries cost neither startup time
+nor per process memory and are looked up in constant time.
+module2package() consults it ahead of the rules when given as table. Build
+one from a text file with one "module pkg [py2pkg py3pkg]" entry per line:
+
+    python -m pymod2pkg.table [--normalize] SOURCE OUTPUT
+
+With --normalize, names are stored and looked up in their PEP 503 form.
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import pymod2pkg
+
+TABLE_MAGIC = b'PM2PTBL1'
+# magic, flags, entry count, slot count, digest of the flags, slot count
+# and records, which identifies the table in cache keys
+_HEADER = struct.Struct('<8sIII32s')
+# a slot holds the offset of a record, open addressing with linear probing
+_SLOT = struct.Struct('<I')
+_EMPTY = 0xffffffff
+FLAG_NORMALIZED = 1
+
+
+class MappingTable(object):
+    """
+    A memory-mapped mapping table written by build_table()
+
+    path: the table file, a ValueError is raised when it isn't one
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.flags, self.count, self.slots,
+             digest) = _HEADER.unpack_from(self.mm)
+        except struct.error:
+            magic = None
+        if magic != TABLE_MAGIC:
+            self.mm.close()
+            raise ValueError('%s is not a mapping table' % path)
+        self.digest = digest.hex()
+        self.normalized = bool(self.flags & FLAG_NORMALIZED)
+        self.records = _HEADER.size + self.slots * _SLOT.size
+
+    def __repr__(self):
+        return 'MappingTable(%r)' % (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def __reduce__(self):
+        # workers map the file again instead of copying it
+        return (MappingTable, (self.path,))
+
+    def close(self):
+        self.mm.close()
+
+    def _value(self, start):
+        end = self.mm.find(b'\n', start)
+        pkg, py2pkg, py3pkg = self.mm[start:end].decode('utf-8').split('\0')
+        return (pkg, py2pkg or pkg, py3pkg or pkg), end + 1
+
+    def get(self, mod):
+        """Return the (pkg, py2pkg, py3pkg) tuple for mod or None"""
+        if self.normalized:
+            mod = pymod2pkg.canonical_name(mod)
+        key = mod.encode('utf-8') + b'\0'
+        mm = self.mm
+        mask = self.slots - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            offset = _SLOT.unpack_from(mm, _HEADER.size
+                                       + slot * _SLOT.size)[0]
+            if offset == _EMPTY:
+                return None
+            start = self.records + offset
+            if mm[start:start + len(key)] == key:
+                return self._value(start + len(key))[0]
+            slot = (slot + 1) & mask
+
+    def items(self):
+        """Yield the (mod, (pkg, py2pkg, py3pkg)) entries in name order"""
+        pos = self.records
+        for _ in range(self.count):
+            end = self.mm.find(b'\0', pos)
+            mod = self.mm[pos:end].decode('utf-8')
+            value, pos = self._value(end + 1)
+            yield (mod, value)
+
+
+def build_table(entries, path, normalize=False):
+    """Write a mapping table to path
+
+    entries: an iterable of (mod, pkglist) pairs, pkglist being a pkg name
+             or a (pkg, py2pkg, py3pkg) tuple. The first entry of a name
+             wins, as the first matching rule does.
+    normalize: store the PEP 503 form of the names
+    """
+    table = {}
+    for mod, pkglist in entries:
+        if normalize:
+            mod = pymod2pkg.canonical_name(mod)
+        if isinstance(pkglist, str):
+            pkglist = (pkglist,)
+        pkg = pkglist[0]
+        # versioned names equal to the unversioned one aren't stored
+        rest = ['' if p == pkg else p for p in pkglist[1:3]]
+        rest += [''] * (2 - len(rest))
+        if any(c in field for field in [mod, pkg] + rest for c in '\0\n'):
+            raise ValueError('Invalid mapping entry %r' % (mod,))
+        table.setdefault(mod.encode('utf-8'), '\0'.join([pkg] + rest))
+    # at most half full, so lookups rarely probe more than one slot
+    nslots = 1
+    while nslots < 2 * len(table):
+        nslots *= 2
+    slots = [_EMPTY] * nslots
+    records = []
+    size = 0
+    for key in sorted(table):
+        record = key + b'\0' + table[key].encode('utf-8') + b'\n'
+        slot = zlib.crc32(key + b'\0') & (nslots - 1)
+        while slots[slot] != _EMPTY:
+            slot = (slot + 1) & (nslots - 1)
+        slots[slot] = size
+        records.append(record)
+        size += len(record)
+    data = b''.join(records)
+    flags = FLAG_NORMALIZED if normalize else 0
+    # the same records are looked up differently when normalized
+    digest = hashlib.sha256(struct.pack('<II', flags, nslots) + data)
+    header = _HEADER.pack(TABLE_MAGIC, flags, len(table), nslots,
+                          digest.digest())
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('<%dI' % nslots, *slots))
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def read_source(path):
+    """Yield the entries of a text mapping, see build_table()"""
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) not in (2, 4):
+                raise ValueError('%s:%d: expected "module pkg [py2pkg '
+                                 'py3pkg]"' % (path, lineno))
+            yield (fields[0], tuple(fields[1:]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build a mapping table from a text mapping')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Store and look up the names in their PEP 503 '
+                        'form')
+    parser.add_argument('source', help='text file with one "module pkg '
+                        '[py2pkg py3pkg]" entry per line')
+    parser.add_argument('output', help='the table file to write')
+    args = parser.parse_args(argv)
+    try:
+        build_table(read_source(args.source), args.output, args.normalize)
+    except (OSError, ValueError) as ex:
+        print(ex, file=sys.stderr)
+        return 1
+    print('Wrote %s' % args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,9 +14,28 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 
 import pymod2pkg
+from pymod2pkg import analyze
+from pymod2pkg import importer
+from pymod2pkg import requirements
+from pymod2pkg import resolver
+from pymod2pkg import table
+from pymod2pkg.cli import pymod2pkg as pymod2pkg_cli
+from pymod2pkg.cli import reqs2pkg
 
 
 class Pymod2PkgTests(unittest.TestCase):
@@ -63,6 +82,27 @@ class Pymod2PkgTests(unittest.TestCase):
         self.assertEqual(pymod2pkg.module2package(
             'openstack-placement', 'suse'), 'openstack-placement')
 
+    def test_translation_suse_flavours(self):
+        for dist, py3pkg in (('suse', 'python3-devel'),
+                             ('suse_py39', 'python39-devel'),
+                             ('suse_py311', 'python311-devel')):
+            self.assertEqual(pymod2pkg.module2package('devel', dist,
+                             py_vers=['py', 'py3']),
+                             ['python-devel', py3pkg])
+        maps = [pymod2pkg.SUSE_PKG_MAP, pymod2pkg.SUSE_PY39_PKG_MAP,
+                pymod2pkg.SUSE_PY311_PKG_MAP]
+        self.assertEqual(len(set(id(m) for m in maps)), 3)
+        self.assertEqual(len(set(len(m) for m in maps)), 1)
+
+    def test_layered_pkg_map(self):
+        base = [pymod2pkg.SingleRule('foo', 'base-foo'),
+                pymod2pkg.SingleRule('bar', 'base-bar')]
+        overlay = (pymod2pkg.SingleRule('foo', 'overlay-foo'),)
+        pkg_map = pymod2pkg.layered_pkg_map(base, overlay)
+        self.assertEqual([r.pkg for r in pkg_map],
+                         ['overlay-foo', 'base-bar'])
+        self.assertEqual(len(base), 2)
+
     def test_translation_ubuntu(self):
         self.assertEqual(pymod2pkg.module2package('nova', 'ubuntu'),
                          'python-nova')
@@ -198,6 +238,1024 @@ class RegexRuleTests(unittest.TestCase):
         self.assertEqual(rule('dummy-ui', 'rdo'),
                          ('openstack-dummy-ui', '', ''))
 
+    def test_precompiled_pattern(self):
+        rule = pymod2pkg.RegexRule(re.compile('^xstatic', re.IGNORECASE),
+                                   pymod2pkg.rdo_xstatic_tr)
+        cmap = pymod2pkg.CompiledRuleMap([rule])
+        self.assertEqual(cmap.resolve('XStatic-foo', 'rdo')[0],
+                         'python-XStatic-foo')
+        self.assertIsNone(cmap.resolve('foo', 'rdo'))
+
+
+class SingleRuleTests(unittest.TestCase):
+    def test_distmap(self):
+        rule = pymod2pkg.SingleRule('sphinx', 'python-sphinx',
+                                    distmap={'epel-6': 'python-sphinx10'})
+        self.assertEqual(rule('sphinx', 'epel-6'), 'python-sphinx10')
+        self.assertEqual(rule('sphinx', 'epel-6'), 'python-sphinx10')
+        self.assertEqual(rule('sphinx', 'fedora'),
+                         ('python-sphinx', 'python-sphinx', 'python-sphinx'))
+        self.assertIsNone(rule('Sphinx', 'epel-6'))
+
+
+class DistProfileTests(unittest.TestCase):
+    def test_builtin_profiles(self):
+        for dist, name in (('Fedora', 'rdo'), ('centos', 'rdo'),
+                           ('opensuse-leap', 'suse'), ('SLES', 'suse'),
+                           ('suse_py311', 'suse_py311'),
+                           ('Ubuntu', 'ubuntu')):
+            self.assertEqual(pymod2pkg.dist_profile(dist).name, name)
+        self.assertEqual(pymod2pkg.dist_profile('ubuntu-22.04').delimiter,
+                         ', ')
+        self.assertIsNone(pymod2pkg.dist_profile('u').delimiter)
+
+    def test_register(self):
+        patcher = mock.patch.object(pymod2pkg, '_DIST_PROFILES',
+                                    list(pymod2pkg._DIST_PROFILES))
+        patcher.start()
+        self.addCleanup(pymod2pkg.cache_clear)
+        self.addCleanup(pymod2pkg._DIST_PROFILE_CACHE.clear)
+        self.addCleanup(patcher.stop)
+        self.assertEqual(pymod2pkg.module2package('six', 'Debian'),
+                         'python-six')
+
+        def default_debian_tr(mod):
+            return ('python-' + mod, 'python-' + mod, 'python3-' + mod)
+
+        pymod2pkg.register_dist_profile(pymod2pkg.DistProfile(
+            'debian', [pymod2pkg.SingleRule('PyYAML', 'python-yaml',
+                                            py3pkg='python3-yaml')],
+            default_debian_tr, patterns=['debian'], prefix='Depends',
+            delimiter=', '))
+        self.assertEqual(pymod2pkg.module2package('PyYAML', 'Debian',
+                                                  py_vers=['py3']),
+                         'python3-yaml')
+        self.assertEqual(pymod2pkg.module2package('six', 'Debian',
+                                                  py_vers=['py3']),
+                         'python3-six')
+        self.assertIn('debian', pymod2pkg.all_dists())
+        self.assertEqual(reqs2pkg.get_default_prefix('debian'), 'Depends')
+
+
+class CompiledRuleMapTests(unittest.TestCase):
+    def _names(self, pkg_map):
+        names = ['oslo.db', 'Babel', 'foobar', 'XStatic-jquery-ui',
+                 'zomg-dashboard', 'neutron-fwaas-dashboard',
+                 'keystone-tempest-plugin', 'python-zomgclient']
+        for rule in pkg_map:
+            if isinstance(rule, pymod2pkg.SingleRule):
+                names.append(rule.mod)
+            elif isinstance(rule, pymod2pkg.MultiRule):
+                names.extend(rule.mods)
+        return names
+
+    def test_same_result_as_linear_scan(self):
+        for dist in ('fedora', 'suse', 'suse_py39', 'ubuntu'):
+            pkg_map = pymod2pkg.get_pkg_map(dist)
+            cmap = pymod2pkg.CompiledRuleMap(pkg_map)
+            for mod in self._names(pkg_map):
+                self.assertEqual(cmap.resolve(mod, dist),
+                                 pymod2pkg._scan_rules(pkg_map, mod, dist))
+
+    def test_first_match_wins(self):
+        pkg_map = [
+            pymod2pkg.RegexRule(r'^foo', lambda mod: ('re', 're', 're')),
+            pymod2pkg.SingleRule('foobar', 'single'),
+            pymod2pkg.SingleRule('foobar', 'shadowed'),
+            pymod2pkg.SingleRule('bar', 'single'),
+            pymod2pkg.RegexRule(r'^ba', lambda mod: ('re2', 're2', 're2')),
+        ]
+        cmap = pymod2pkg.CompiledRuleMap(pkg_map)
+        self.assertEqual(cmap.resolve('foobar', 'rdo')[0], 're')
+        self.assertEqual(cmap.resolve('bar', 'rdo')[0], 'single')
+        self.assertEqual(cmap.resolve('baz', 'rdo')[0], 're2')
+        self.assertIsNone(cmap.resolve('qux', 'rdo'))
+
+    def test_stale_after_rule_change(self):
+        rule = pymod2pkg.MultiRule(pymod2pkg.RuleList(['foo']),
+                                   lambda mod: (mod, mod, mod))
+        pkg_map = [rule]
+        cmap = pymod2pkg.CompiledRuleMap(pkg_map)
+        self.assertTrue(cmap.is_current(pkg_map))
+        rule.mods.append('bar')
+        self.assertFalse(cmap.is_current(pkg_map))
+        cmap = pymod2pkg.compile_pkg_map(pkg_map)
+        self.assertEqual(cmap.resolve('bar', 'rdo')[0], 'bar')
+        rule.pkgfun = lambda mod: ('x', 'x', 'x')
+        self.assertFalse(cmap.is_current(pkg_map))
+
+    def test_custom_rule_kept_in_order(self):
+        class AnyRule(pymod2pkg.TranslationRule):
+            def __call__(self, mod, dist):
+                return ('any', 'any', 'any')
+
+        pkg_map = [pymod2pkg.SingleRule('foo', 'foo'), AnyRule()]
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'foo')
+        self.assertEqual(pymod2pkg.module2package('bar', 'rdo', pkg_map),
+                         'any')
+
+    def test_recompiled_after_map_change(self):
+        pkg_map = [pymod2pkg.SingleRule('foo', 'foo-pkg')]
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'foo-pkg')
+        pkg_map.insert(0, pymod2pkg.SingleRule('foo', 'other-pkg'))
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'other-pkg')
+
+    def test_normalized_lookup(self):
+        pkg_map = [
+            pymod2pkg.SingleRule('PyYAML', 'yaml'),
+            pymod2pkg.SingleRule('pyyaml', 'exact'),
+            pymod2pkg.RegexRule(r'^semantic', lambda mod: ('re', 're', 're')),
+            pymod2pkg.MultiRule(['semantic-version'],
+                                lambda mod: (mod, mod, mod)),
+        ]
+        m2p = pymod2pkg.module2package
+        self.assertEqual(m2p('PYYAML', 'rdo', pkg_map), 'python-pyyaml')
+        self.assertEqual(m2p('PYYAML', 'rdo', pkg_map, normalize=True),
+                         'yaml')
+        # exact spellings still win
+        self.assertEqual(m2p('pyyaml', 'rdo', pkg_map, normalize=True),
+                         'exact')
+        # and so do earlier rules
+        self.assertEqual(m2p('semantic_version', 'rdo', pkg_map,
+                             normalize=True), 're')
+        # translated as the spelling of the rule is
+        self.assertEqual(m2p('Semantic_Version', 'rdo', pkg_map,
+                             normalize=True), 're')
+        self.assertEqual(m2p('Semantic_Version', 'rdo', pkg_map[3:],
+                             normalize=True), 'semantic-version')
+        self.assertEqual(m2p('xstatic-term-js', 'fedora', normalize=True),
+                         'python-XStatic-termjs')
+        self.assertEqual(m2p('pyyaml', 'ubuntu', normalize=True),
+                         'python-yaml')
+
+
+class AnalyzeTests(unittest.TestCase):
+    def test_dead_rules(self):
+        stacked = (pymod2pkg.SUSE_PY39_OVERLAY
+                   + tuple(pymod2pkg.SUSE_COMMON_PKG_MAP))
+        dead = [s for s in analyze.shadowed_rules(stacked) if s.dead]
+        self.assertEqual([(s.rule.mod, s.shadowed_by) for s in dead],
+                         [('devel', [0])])
+        for profile in pymod2pkg.dist_profiles():
+            self.assertEqual(analyze.shadowed_rules(profile.pkg_map), [])
+
+    def test_shadowed_by_regex(self):
+        rules = [pymod2pkg.RegexRule(r'^foo-\w+', lambda m: (m, m, m)),
+                 pymod2pkg.MultiRule(['foo-a', 'bar'],
+                                     lambda m: (m, m, m))]
+        shadowed, = analyze.shadowed_rules(rules)
+        self.assertEqual((shadowed.dead, shadowed.names), (False, ['foo-a']))
+        self.assertEqual(analyze.order_dependencies(rules), [(0, 1)])
+
+    def test_may_overlap(self):
+        def regex(pattern):
+            return pymod2pkg.RegexRule(pattern, lambda m: (m, m, m))
+        self.assertFalse(analyze.may_overlap(regex('^XStatic.*'),
+                                             regex(r'^oslo\.')))
+        self.assertTrue(analyze.may_overlap(regex('^XStatic.*'),
+                                            regex('^XS')))
+        self.assertTrue(analyze.may_overlap(regex('^a|XStatic'),
+                                            regex('^b')))
+        self.assertTrue(analyze.may_overlap(regex('^ab?c'), regex('^ac')))
+        self.assertEqual(analyze.literal_prefix(r'^oslo\.db'), 'oslo.db')
+
+    def test_reorder_keeps_results(self):
+        pkg_map = pymod2pkg.RDO_PKG_MAP
+        rand = random.Random(42)
+        hits = dict((pos, rand.randrange(100))
+                    for pos in range(len(pkg_map)))
+        order = analyze.reorder(pkg_map, hits)
+        self.assertEqual(sorted(order), list(range(len(pkg_map))))
+        self.assertNotEqual(order, list(range(len(pkg_map))))
+        mods = analyze.corpus(pkg_map, ['XStatic-foo', 'foo-dashboard',
+                                        'foo-tempest-plugin', 'nova'])
+        self.assertEqual(analyze.verify_order(pkg_map, order, 'rdo', mods),
+                         [])
+        # the hot regex doesn't jump over the rule it must follow
+        xstatic = [pos for pos, rule in enumerate(pkg_map)
+                   if getattr(rule, 'mod', None) == 'XStatic-term.js'][0]
+        regex = len(pkg_map) - 3
+        self.assertLess(order.index(xstatic), order.index(regex))
+
+    def test_stats_of_dist_names(self):
+        stats = pymod2pkg.RuleStats()
+        stats.record('fedora', pymod2pkg.RDO_PKG_MAP, 1)
+        stats.record('centos', pymod2pkg.RDO_PKG_MAP, 1)
+        stats.record('centos', pymod2pkg.RDO_PKG_MAP, 2)
+        hits = analyze.hits_from_stats(stats.report(), 'rdo',
+                                       pymod2pkg.RDO_PKG_MAP)
+        self.assertEqual((hits[1], hits[2], hits[0]), (2, 1, 0))
+        self.assertIsNone(analyze.hits_from_stats(
+            stats.report(), 'ubuntu', pymod2pkg.UBUNTU_PKG_MAP))
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'stats.json')
+        stats.dump(path)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            analyze.main(['--dist', 'rdo', '--stats', path])
+        self.assertIn('proposed order', out.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()) as err:
+            self.assertEqual(
+                analyze.main(['--dist', 'ubuntu', '--stats', path]), 1)
+        self.assertIn('No stats', err.getvalue())
+
+    def test_stats_for_another_map(self):
+        stats = pymod2pkg.RuleStats()
+        stats.record('rdo', pymod2pkg.UBUNTU_PKG_MAP, 0)
+        self.assertRaises(ValueError, analyze.hits_from_stats,
+                          stats.report(), 'rdo', pymod2pkg.RDO_PKG_MAP)
+
+
+class MappingTableTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'table')
+        self.addCleanup(pymod2pkg.cache_clear)
+
+    def _table(self, entries, normalize=False):
+        table.build_table(entries, self.path, normalize)
+        mapping = table.MappingTable(self.path)
+        self.addCleanup(mapping.close)
+        return mapping
+
+    def test_lookup(self):
+        entries = [('mod%05d' % i, 'pkg%d' % i) for i in range(999, -1, -1)]
+        entries.append(('six', ('python-six', 'python2-six', 'python3-six')))
+        entries.append(('mod00001', 'shadowed'))
+        mapping = self._table(entries)
+        self.assertEqual(len(mapping), 1001)
+        self.assertEqual(mapping.get('mod00001'), ('pkg1', 'pkg1', 'pkg1'))
+        self.assertEqual(mapping.get('six'),
+                         ('python-six', 'python2-six', 'python3-six'))
+        self.assertIsNone(mapping.get('mod1'))
+        self.assertIsNone(mapping.get('zzz'))
+        self.assertEqual(list(mapping.items())[0],
+                         ('mod00000', ('pkg0', 'pkg0', 'pkg0')))
+
+    def test_normalized(self):
+        mapping = self._table([('PyYAML', 'yaml')], normalize=True)
+        self.assertEqual(mapping.get('py.yaml'), None)
+        self.assertEqual(mapping.get('pyyaml')[0], 'yaml')
+
+    def test_normalized_digest(self):
+        # lowercase records, which are the same when normalized
+        entries = [('pyyaml', 'T')]
+        normalized = self._table(entries, normalize=True)
+        table.build_table(entries, self.path + '.plain')
+        plain = table.MappingTable(self.path + '.plain')
+        self.addCleanup(plain.close)
+        self.assertNotEqual(normalized.digest, plain.digest)
+        self.assertEqual(pymod2pkg.module2package('PyYAML', 'fedora',
+                                                  table=normalized), 'T')
+        self.assertEqual(pymod2pkg.module2package('PyYAML', 'fedora',
+                                                  table=plain),
+                         'python-pyyaml')
+
+    def test_ahead_of_rules(self):
+        mapping = self._table([('nova', 'nova-from-table')])
+        self.assertEqual(pymod2pkg.module2package('nova', 'fedora'),
+                         'openstack-nova')
+        self.assertEqual(pymod2pkg.module2package('nova', 'fedora',
+                                                  table=mapping),
+                         'nova-from-table')
+        self.assertEqual(pymod2pkg.module2packages(['nova', 'Babel'],
+                                                   'fedora', table=mapping),
+                         {'nova': ('nova-from-table',),
+                          'Babel': ('python-babel',)})
+        self.assertEqual(pymod2pkg.explain('nova', 'fedora',
+                                           table=mapping).position, 'table')
+
+    def test_pickle(self):
+        import pickle
+
+        mapping = self._table([('nova', 'nova-from-table')])
+        copy = pickle.loads(pickle.dumps(mapping))
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.get('nova')[0], 'nova-from-table')
+
+    def test_not_a_table(self):
+        with open(self.path, 'w') as f:
+            f.write('nova openstack-nova\n')
+        self.assertRaises(ValueError, table.MappingTable, self.path)
+
+    def test_build_from_source(self):
+        source = self.path + '.txt'
+        with open(source, 'w') as f:
+            f.write('# generated\nnova nova-pkg\nsix python-six python2-six '
+                    'python3-six\n')
+        self.assertEqual(table.main([source, self.path]), 0)
+        reqs = self.path + '.reqs'
+        with open(reqs, 'w') as f:
+            f.write('nova\nsix\n')
+        out = io.StringIO()
+        argv = ['reqs2pkg', '--dist', 'fedora', '--pyver', 'py3', '-b',
+                '--table', self.path, '-r', reqs]
+        with mock.patch.object(sys, 'argv', argv), \
+                contextlib.redirect_stdout(out):
+            self.assertEqual(reqs2pkg.main(), 0)
+        self.assertEqual(out.getvalue(), 'nova-pkg\npython3-six\n')
+
+
+class ImporterTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.output = os.path.join(self.tmpdir, 'table')
+
+    def _import(self, name, content, opener=open):
+        path = os.path.join(self.tmpdir, name)
+        with opener(path, 'wt') as f:
+            f.write(content)
+        self.assertEqual(importer.main(['-o', self.output, path]), 0)
+        mapping = table.MappingTable(self.output)
+        self.addCleanup(mapping.close)
+        return mapping
+
+    def test_rpm_xml(self):
+        import gzip
+
+        mapping = self._import('primary.xml.gz', """<?xml version="1.0"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common"
+          xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="3">
+<package type="rpm"><name>python3-pyyaml</name><format>
+<rpm:provides><rpm:entry name="python3dist(pyyaml)"/>
+<rpm:entry name="python3.12dist(pyyaml)"/></rpm:provides>
+<rpm:requires><rpm:entry name="python3dist(six)"/></rpm:requires>
+</format></package>
+<package type="rpm"><name>python3-six</name><format>
+<rpm:provides><rpm:entry name="python3dist(six)"/></rpm:provides>
+</format></package>
+<package type="rpm"><name>python3.11-six</name><format>
+<rpm:provides><rpm:entry name="python3dist(six)"/></rpm:provides>
+</format></package>
+</metadata>
+""", gzip.open)
+        self.assertEqual(dict(mapping.items()), {
+            'pyyaml': ('python3-pyyaml',) * 3,
+            'six': ('python3-six',) * 3})
+        self.assertEqual(pymod2pkg.module2package('PyYAML', 'fedora',
+                                                  table=mapping),
+                         'python3-pyyaml')
+
+    def test_rpm_sqlite(self):
+        import sqlite3
+
+        path = os.path.join(self.tmpdir, 'primary.sqlite')
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE provides (name TEXT, pkgKey INTEGER);
+            INSERT INTO packages VALUES (1, 'python2-six'), (2, 'python3-six');
+            INSERT INTO provides VALUES ('python2dist(six)', 1),
+                ('python3dist(six)', 2), ('python3-six', 2);
+        """)
+        conn.close()
+        self.assertEqual(importer.main(['-o', self.output, path]), 0)
+        mapping = table.MappingTable(self.output)
+        self.addCleanup(mapping.close)
+        self.assertEqual(dict(mapping.items()), {
+            'six': ('python3-six', 'python2-six', 'python3-six')})
+
+    def test_deb(self):
+        packages = ('Package: python3-yaml\nSource: pyyaml (5.4.1-1)\n'
+                    'Description: YAML\n multi-line\n\n'
+                    'Package: libyaml-0-2\nSource: libyaml\n\n'
+                    'Package: python3-babel\nSource: python-babel\n\n'
+                    'Package: python3-six\n')
+        # python3-six is its own source
+        self.assertEqual(dict(self._import('Packages', packages).items()),
+                         {'pyyaml': ('python3-yaml',) * 3,
+                          'babel': ('python3-babel',) * 3,
+                          'six': ('python3-six',) * 3})
+        sources = ('Package: pyyaml\nBinary: python3-yaml,\n'
+                   ' python3-yaml-dbg, libyaml-dev\n\n'
+                   'Package: python-babel\nBinary: python3-babel\n')
+        self.assertEqual(dict(self._import('Sources.xz', sources,
+                                           importer.lzma.open).items()),
+                         {'pyyaml': ('python3-yaml',) * 3,
+                          'babel': ('python3-babel',) * 3})
+
+    def test_deb_utf8(self):
+        path = os.path.join(self.tmpdir, 'Packages')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Package: python3-yaml\nSource: pyyaml\n'
+                    'Maintainer: J\u00f6rg <j@example.com>\n')
+        env = dict(os.environ, LC_ALL='C', PYTHONUTF8='0',
+                   PYTHONCOERCECLOCALE='0')
+        subprocess.check_call(
+            [sys.executable, '-m', 'pymod2pkg.importer', '-o', self.output,
+             path], env=env, stdout=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        mapping = table.MappingTable(self.output)
+        self.addCleanup(mapping.close)
+        self.assertEqual(mapping.get('pyyaml'), ('python3-yaml',) * 3)
+
+
+class ResolverTests(unittest.TestCase):
+    def test_candidates(self):
+        names = resolver.candidates('python-Oslo_db')
+        self.assertEqual(names[:6], ['python-Oslo_db', 'python-oslo_db',
+                                     'python-Oslo-db', 'python-oslo-db',
+                                     'python-Oslo.db', 'python-oslo.db'])
+        self.assertIn('python3-oslo-db', names)
+        self.assertIn('python2-oslo.db', names)
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(resolver.candidates('six')[:3],
+                         ['six', 'python3-six', 'python-six'])
+
+    def test_resolve(self):
+        index = resolver.PackageIndex(['python3-oslo-db', 'python-babel',
+                                       'openstack-nova'])
+        self.assertEqual(resolver.resolve('nova', 'fedora', index),
+                         ('nova', 'fedora', 'openstack-nova',
+                          'openstack-nova', resolver.EXACT))
+        self.assertEqual(resolver.resolve('oslo_db', 'fedora', index,
+                                          py_ver='py3')[2:],
+                         ('python3-oslo-db', 'python3-oslo-db',
+                          resolver.EXACT))
+        self.assertEqual(resolver.resolve('oslo_db', 'fedora', index)[2:],
+                         ('python3-oslo-db', 'python-oslo-db',
+                          resolver.CANDIDATE))
+        self.assertEqual(resolver.resolve('zomg', 'fedora', index)[2:],
+                         ('python-zomg', 'python-zomg', resolver.MISSING))
+
+    def test_resolve_dist_prefixes(self):
+        index = resolver.PackageIndex(['python3-oslo.db', 'python311-six'])
+        self.assertEqual(resolver.resolve('oslo_db', 'suse', index)[2:],
+                         ('python3-oslo.db', 'python-oslo_db',
+                          resolver.CANDIDATE))
+        self.assertEqual(resolver.resolve('six', 'suse_py311', index)[2:],
+                         ('python311-six', 'python-six', resolver.CANDIDATE))
+        self.assertEqual(resolver.candidates('python39-six', 'suse_py39')[:2],
+                         ['python39-six', 'python-six'])
+
+    def test_reqs2pkg_index(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        packages = os.path.join(tmpdir, 'Packages')
+        with open(packages, 'w') as f:
+            f.write('Package: python3-babel\n\nPackage: python3-six\n')
+        index = os.path.join(tmpdir, 'index')
+        self.assertEqual(importer.main(['--names', '-o', index, packages]),
+                         0)
+        reqs = os.path.join(tmpdir, 'reqs.txt')
+        with open(reqs, 'w') as f:
+            f.write('Babel\nsix\nzomg\n')
+        out, err = io.StringIO(), io.StringIO()
+        argv = ['reqs2pkg', '--dist', 'ubuntu', '-b', '--index', index,
+                '-r', reqs]
+        with mock.patch.object(sys, 'argv', argv), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(err):
+            self.assertEqual(reqs2pkg.main(), 0)
+        self.assertEqual(out.getvalue(),
+                         'python3-babel\npython3-six\npython-zomg\n')
+        self.assertIn('python-zomg not found', err.getvalue())
+
+
+class TranslationCacheTests(unittest.TestCase):
+    def setUp(self):
+        pymod2pkg.cache_clear()
+        self.addCleanup(pymod2pkg.set_cache_size, 4096)
+        self.addCleanup(pymod2pkg.cache_clear)
+
+    def test_hits_and_misses(self):
+        pymod2pkg.module2package('oslo.db', 'fedora')
+        pymod2pkg.module2package('oslo.db', 'fedora')
+        pymod2pkg.module2package('oslo.db', 'fedora', py_vers=['py3'])
+        pymod2pkg.module2upstream('keystoneauth1')
+        self.assertEqual(pymod2pkg.module2upstream('keystoneauth1'),
+                         'keystoneauth')
+        info = pymod2pkg.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 3, 3))
+        pymod2pkg.cache_clear()
+        self.assertEqual(pymod2pkg.cache_info().currsize, 0)
+
+    def test_evictions(self):
+        pymod2pkg.set_cache_size(2)
+        for mod in ('a', 'b', 'c', 'a'):
+            pymod2pkg.module2package(mod, 'fedora')
+        info = pymod2pkg.cache_info()
+        self.assertEqual((info.misses, info.evictions, info.currsize),
+                         (4, 2, 2))
+
+    def test_invalidated_by_map_change(self):
+        pkg_map = pymod2pkg.RuleList([pymod2pkg.SingleRule('foo', 'foo-pkg')])
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'foo-pkg')
+        pkg_map[0] = pymod2pkg.SingleRule('foo', 'other-pkg')
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'other-pkg')
+        # a plain list is only checked for added or removed rules
+        pkg_map = [pymod2pkg.SingleRule('foo', 'foo-pkg')]
+        pymod2pkg.module2package('foo', 'rdo', pkg_map)
+        pkg_map.insert(0, pymod2pkg.SingleRule('foo', 'other-pkg'))
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'other-pkg')
+
+    def test_invalidated_by_rule_change(self):
+        self.assertEqual(pymod2pkg.module2package('zomg', 'rdo'),
+                         'python-zomg')
+        pymod2pkg.SERVICES_MAP.append('zomg')
+        self.addCleanup(pymod2pkg.SERVICES_MAP.remove, 'zomg')
+        self.assertEqual(pymod2pkg.module2package('zomg', 'rdo'),
+                         'openstack-zomg')
+        rule = pymod2pkg.SingleRule('foo', 'foo-pkg')
+        pkg_map = [rule]
+        pymod2pkg.module2package('foo', 'rdo', pkg_map)
+        rule.pkg = 'other-pkg'
+        self.assertEqual(pymod2pkg.module2package('foo', 'rdo', pkg_map),
+                         'other-pkg')
+
+    def test_clear_after_untracked_change(self):
+        mods = ['foo']
+        pkg_map = [pymod2pkg.MultiRule(mods, lambda mod: (mod + '-pkg',) * 3)]
+        pymod2pkg.module2package('foo', 'rdo', pkg_map)
+        mods.append('bar')
+        pymod2pkg.cache_clear()
+        self.assertEqual(pymod2pkg.module2package('bar', 'rdo', pkg_map),
+                         'bar-pkg')
+
+    def test_result_list_not_shared(self):
+        pkgs = pymod2pkg.module2package('nova', 'suse',
+                                        py_vers=['py2', 'py3'])
+        pkgs.append('junk')
+        self.assertEqual(pymod2pkg.module2package('nova', 'suse',
+                                                  py_vers=['py2', 'py3']),
+                         ['openstack-nova', 'openstack-nova'])
+
+
+class Module2PackagesTests(unittest.TestCase):
+    def test_batch_matches_single(self):
+        mods = ['nova', 'oslo.db', 'Babel', 'XStatic-jquery-ui', 'nova']
+        for dist in ('fedora', 'suse', 'ubuntu'):
+            pkgs = pymod2pkg.module2packages(mods, dist,
+                                             py_vers=['py2', 'py3'])
+            self.assertEqual(list(pkgs), mods[:4])
+            for mod in mods:
+                self.assertEqual(
+                    list(pkgs[mod]),
+                    pymod2pkg.module2package(mod, dist,
+                                             py_vers=['py2', 'py3']))
+
+    def test_always_tuples(self):
+        pkgs = pymod2pkg.module2packages((m for m in ['nova']), 'suse')
+        self.assertEqual(pkgs, {'nova': ('openstack-nova',)})
+
+    def test_invalid_version(self):
+        self.assertRaises(Exception, pymod2pkg.module2packages,
+                          ['nova'], 'suse', py_vers=['py4'])
+
+
+class MatrixTests(unittest.TestCase):
+    def test_matrix_matches_single(self):
+        mods = ['nova', 'PyYAML', 'oslo.db', 'devel', 'nova']
+        matrix = pymod2pkg.module2package_matrix(
+            iter(mods), py_vers=['py2', 'py3'])
+        self.assertEqual(list(matrix), ['nova', 'PyYAML', 'oslo.db', 'devel'])
+        for mod, row in matrix.items():
+            self.assertEqual(list(row), pymod2pkg.all_dists())
+            for dist, pkgs in row.items():
+                self.assertEqual(list(pkgs), pymod2pkg.module2package(
+                    mod, dist, py_vers=['py2', 'py3']))
+
+    def test_reqs2pkg_dists(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'reqs.txt')
+        with open(path, 'w') as f:
+            f.write('nova\nPyYAML\n')
+        out = io.StringIO()
+        argv = ['reqs2pkg', '-b', '--dist', 'fedora', '--dist', 'ubuntu',
+                '-r', path]
+        with mock.patch.object(sys, 'argv', argv), \
+                contextlib.redirect_stdout(out):
+            self.assertEqual(reqs2pkg.main(), 0)
+        self.assertEqual(out.getvalue(),
+                         '[fedora]\nopenstack-nova\npython-pyyaml\n'
+                         '[ubuntu]\npython-nova\npython-yaml\n')
+
+
+class Package2ModuleTests(unittest.TestCase):
+    def test_rules(self):
+        self.assertEqual(pymod2pkg.package2module('python3-pyyaml', 'fedora'),
+                         ['PyYAML'])
+        self.assertEqual(pymod2pkg.package2module('openstack-nova', 'suse'),
+                         ['nova'])
+        self.assertEqual(
+            pymod2pkg.package2module('python3-XStatic-termjs', 'fedora'),
+            ['XStatic-term.js', 'XStatic-termjs'])
+        self.assertEqual(
+            pymod2pkg.package2module('openstack-dashboard', 'suse'),
+            ['horizon'])
+
+    def test_regex_rules(self):
+        self.assertEqual(
+            pymod2pkg.package2module('openstack-foo-ui', 'fedora'),
+            ['foo-ui', 'foo-dashboard'])
+        self.assertEqual(
+            pymod2pkg.package2module('openstack-horizon-plugin-foo-ui',
+                                     'suse'),
+            ['foo-ui', 'foo-dashboard'])
+        self.assertEqual(
+            pymod2pkg.package2module('python3-foo-tests-tempest', 'fedora'),
+            ['foo-tempest-plugin'])
+        self.assertEqual(
+            pymod2pkg.package2module('python-XStatic-foo', 'fedora'),
+            ['XStatic-foo'])
+
+    def test_ambiguous(self):
+        self.assertEqual(pymod2pkg.package2module('python-suds', 'fedora'),
+                         ['suds-community', 'suds-jurko', 'suds'])
+        self.assertEqual(
+            pymod2pkg.package2module('python2-cinderclient', 'suse'),
+            ['python-cinderclient', 'cinderclient'])
+
+    def test_default_translations(self):
+        self.assertEqual(pymod2pkg.package2module('python3-oslo-db', 'fedora'),
+                         ['oslo-db'])
+        self.assertEqual(pymod2pkg.package2module('python3-oslo.db', 'suse'),
+                         ['oslo.db'])
+        self.assertEqual(pymod2pkg.package2module('python-six', 'ubuntu'),
+                         ['six'])
+        # the default translation doesn't produce upper case on RDO
+        self.assertEqual(pymod2pkg.package2module('python-Foo', 'fedora'),
+                         [])
+        self.assertEqual(pymod2pkg.package2module('bash', 'fedora'), [])
+
+
+class ExplainTests(unittest.TestCase):
+    def test_explain_rule(self):
+        exp = pymod2pkg.explain('PyYAML', 'fedora')
+        self.assertIs(exp.rule, pymod2pkg.RDO_PKG_MAP[exp.position])
+        self.assertEqual(exp.scanned, exp.position + 1)
+        self.assertEqual(exp.pkgs, ('python-pyyaml', 'python-pyyaml',
+                                    'python3-pyyaml'))
+
+    def test_explain_default(self):
+        exp = pymod2pkg.explain('oslo.db', 'suse')
+        self.assertIs(exp.rule, pymod2pkg.default_suse_tr)
+        self.assertIsNone(exp.position)
+        self.assertEqual(exp.scanned, len(pymod2pkg.SUSE_PKG_MAP))
+
+    def test_rule_stats(self):
+        self.addCleanup(pymod2pkg.disable_rule_stats)
+        stats = pymod2pkg.enable_rule_stats()
+        for mod in ('nova', 'nova', 'oslo.db'):
+            pymod2pkg.module2package(mod, 'ubuntu')
+        pymod2pkg.module2packages(['nova', 'PyYAML', 'nova'], 'ubuntu')
+        report = stats.report()['ubuntu']
+        self.assertEqual(report['fallback'], 5)
+        hits = dict((r['rule'], r['hits']) for r in report['rules'])
+        self.assertEqual(hits["SingleRule('PyYAML', 'python-yaml')"], 1)
+        self.assertEqual(hits["SingleRule('GitPython', 'python-git')"], 0)
+
+
+class Reqs2PkgTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _run(self, *argv):
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch.object(sys, 'argv', ['reqs2pkg'] + list(argv)), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(err):
+            ret = reqs2pkg.main()
+        return ret, out.getvalue(), err.getvalue()
+
+    def test_parse_requirements(self):
+        path = self._write('reqs.txt', '# comment\n\nnova>1 # foo\n'
+                                       '-r other.txt\n-c upper.txt\nBabel\n')
+        self.assertEqual(
+            requirements.parse_requirements(path),
+            (path, [(False, 'nova', None, 3, 'nova>1 # foo'),
+                    (True, os.path.join(self.tmpdir, 'other.txt'), None, 4,
+                     '-r other.txt'),
+                    (False, 'Babel', None, 6, 'Babel')], None))
+
+    def test_parse_requirement_skips(self):
+        for line in ('-e git+https://opendev.org/openstack/nova',
+                     '--index-url https://pypi.org/simple',
+                     '-f ./wheels', 'https://example.com/foo.tar.gz',
+                     'git+https://opendev.org/openstack/nova', './nova',
+                     '/srv/nova'):
+            self.assertIsNone(requirements.parse_requirement(line))
+
+    def test_parse_requirement_matches_packaging(self):
+        import packaging.requirements
+
+        rand = random.Random(42)
+        names = ['nova', 'oslo.db', 'oslo_db', 'Babel', 'python-novaclient',
+                 'XStatic-term.js', 'a', 'A1', 'zope.interface', 'foo-',
+                 '_foo', 'foo..bar']
+        extras = ['', '[test]', '[ test , doc ]', '[]', '[te st]', '[']
+        specs = ['', '>=1.0', '>=1.0,<2', ' != 1.2.3 , >= 1.0a1',
+                 '==1.0.*', '>=1.0.*', '~=1', '~=1.4.2', '==1.0+local',
+                 '<=2.0.post1.dev3', '===1.0', '(>=1.0)', '>=', '>= 1 2',
+                 '>1!2.0', '<1.0rc1', '== 2.0b2']
+        markers = ['', ';python_version>="3"', "; python_version < '3.8'",
+                   ';sys_platform=="win32" and python_version>="3.6"',
+                   ';extra == "test"', ';', ';python_version >> "3"',
+                   ' ; os_name == "posix"', ';python_version in "3.8 3.9"']
+        lines = ['nova @ https://example.com/nova.tar.gz',
+                 'nova@https://example.com/nova.tar.gz ; os_name=="nt"']
+        for _ in range(10000):
+            lines.append('%s%s%s%s' % (rand.choice(names),
+                                       rand.choice(extras),
+                                       rand.choice(specs),
+                                       rand.choice(markers)))
+        for line in lines:
+            line = line.strip()
+            try:
+                req = packaging.requirements.Requirement(line)
+                expected = (req.name, str(req.marker) if req.marker else None)
+            except ValueError:
+                expected = 'invalid'
+            try:
+                parsed = requirements.parse_requirement(line)
+            except ValueError:
+                parsed = 'invalid'
+            self.assertEqual(parsed, expected, line)
+
+    def test_markers(self):
+        path = self._write('reqs.txt',
+                           'nova;python_version>="3"\n'
+                           'Babel;python_version<"3"\n'
+                           'oslo.db;python_version>="3.11"\n')
+        ret, out, err = self._run('--dist', 'fedora', '-b', '--pyver', 'py2',
+                                  '-r', path)
+        self.assertEqual(out, 'python-babel\n')
+        ret, out, err = self._run('--dist', 'suse_py39', '-b', '-r', path)
+        self.assertEqual(out, 'openstack-nova\n')
+        ret, out, err = self._run('--dist', 'suse_py39', '-b', '-r', path,
+                                  '--marker-env', 'python_version=3.12')
+        self.assertEqual(out, 'openstack-nova\npython-oslo.db\n')
+
+    def test_includes(self):
+        shared = self._write('shared.txt', 'Babel\n-c constraints.txt\n')
+        first = self._write('a.txt', 'nova\n-r shared.txt\n')
+        second = self._write('b.txt', '--requirement=%s\nnova\n' % shared)
+        for jobs in ('1', '2'):
+            ret, out, err = self._run('--dist', 'fedora', '-b', '-j', jobs,
+                                      '-r', first, '-r', second)
+            self.assertEqual(ret, 0)
+            self.assertEqual(out, 'openstack-nova\npython-babel\n'
+                                  'python-babel\nopenstack-nova\n')
+            ret, out, err = self._run('--dist', 'fedora', '-b', '-j', jobs,
+                                      '-u', '-r', first, '-r', second)
+            self.assertEqual(out, 'openstack-nova\npython-babel\n')
+
+    def test_shared_include_parsed_once(self):
+        self._write('shared.txt', 'Babel\n')
+        first = self._write('a.txt', '-r shared.txt\n')
+        second = self._write('b.txt', '-r shared.txt\n')
+        parse_requirements = requirements.parse_requirements
+        with mock.patch.object(requirements, 'parse_requirements',
+                               wraps=parse_requirements) as parse:
+            results = list(requirements.iter_translated([first, second],
+                                                        'fedora', ['py']))
+        self.assertEqual(parse.call_count, 3)
+        self.assertEqual([r[1] for r in results],
+                         [['python-babel'], ['python-babel']])
+
+    def test_include_cycle(self):
+        first = self._write('a.txt', 'nova\n-r b.txt\n')
+        self._write('b.txt', '-r a.txt\n')
+        ret, out, err = self._run('--dist', 'fedora', '-b', '-r', first)
+        self.assertEqual(ret, 1)
+        self.assertIn('Include cycle', err)
+
+    def test_missing_file_does_not_abort(self):
+        first = self._write('a.txt', 'nova\n')
+        second = self._write('b.txt', 'Babel\n')
+        missing = os.path.join(self.tmpdir, 'missing.txt')
+        for jobs in ('1', '2'):
+            ret, out, err = self._run('--dist', 'fedora', '-b', '-j', jobs,
+                                      '-r', first, '-r', missing,
+                                      '-r', second)
+            self.assertEqual(ret, 1)
+            self.assertEqual(out, 'openstack-nova\npython-babel\n')
+            self.assertIn('missing.txt', err)
+
+    def test_release(self):
+        os.makedirs(os.path.join(self.tmpdir, 'nova', 'doc'))
+        os.makedirs(os.path.join(self.tmpdir, 'oslo.db'))
+        self._write('nova/requirements.txt', 'Babel\noslo.db\n')
+        self._write('nova/doc/requirements.txt', 'Babel\n')
+        self._write('oslo.db/test-requirements.txt', 'Babel\n')
+        for jobs in ('1', '2'):
+            ret, out, err = self._run('--dist', 'fedora', '-j', jobs,
+                                      '--release', self.tmpdir)
+            self.assertEqual(ret, 0)
+            self.assertEqual([json.loads(line) for line in out.splitlines()], [
+                {'project': 'nova', 'dist': 'fedora',
+                 'packages': ['python-babel', 'python-oslo-db']},
+                {'project': 'oslo.db', 'dist': 'fedora',
+                 'packages': ['python-babel']},
+                {'package': 'python-babel', 'dist': 'fedora',
+                 'projects': ['nova', 'oslo.db']},
+                {'package': 'python-oslo-db', 'dist': 'fedora',
+                 'projects': ['nova']}])
+
+    def test_release_project_list(self):
+        os.makedirs(os.path.join(self.tmpdir, 'nova'))
+        self._write('nova/requirements.txt', 'Babel\n')
+        projects = self._write('projects.txt', '# release\nnova\nmissing\n')
+        ret, out, err = self._run('--dist', 'fedora', '--release', projects)
+        self.assertEqual(ret, 1)
+        self.assertIn('missing', err)
+        self.assertEqual([json.loads(line)['projects']
+                          for line in out.splitlines()[-1:]], [['nova']])
+
+    def test_iter_requirement_packages(self):
+        self._write('other.txt', 'Babel\n')
+        path = self._write('reqs.txt', 'nova>1  # foo\n-r other.txt\n'
+                                       'six; python_version < "3"\n')
+        records = list(requirements.iter_requirement_packages(
+            path, 'fedora', ['py', 'py3']))
+        other = os.path.join(self.tmpdir, 'other.txt')
+        self.assertEqual(records, [
+            (path, 1, 'nova>1  # foo', 'nova', None, True,
+             ('openstack-nova', 'openstack-nova')),
+            (other, 1, 'Babel', 'Babel', None, True,
+             ('python-babel', 'python3-babel')),
+            (path, 3, 'six; python_version < "3"', 'six',
+             'python_version < "3"', False, None)])
+        records = requirements.iter_requirement_packages(
+            io.StringIO('oslo.db\n'), 'ubuntu')
+        self.assertEqual([(r.source, r.packages) for r in records],
+                         [('<lines>', ('python-oslo.db',))])
+
+    def test_iter_requirement_packages_errors(self):
+        self._write('b.txt', '-r a.txt\n')
+        path = self._write('a.txt', '-r b.txt\n')
+        with self.assertRaisesRegex(ValueError, 'Include cycle'):
+            list(requirements.iter_requirement_packages(path, 'fedora'))
+        records = requirements.iter_requirement_packages(
+            ['nova\n', 'foo>=1 bar\n'], 'fedora', source='reqs')
+        self.assertEqual(next(records).name, 'nova')
+        with self.assertRaisesRegex(ValueError, '^reqs:2: '):
+            next(records)
+        # files are read lazily too
+        path = self._write('c.txt', 'nova\nfoo>=1 bar\n')
+        records = requirements.iter_requirement_packages(path, 'fedora')
+        self.assertEqual(next(records).name, 'nova')
+        with self.assertRaisesRegex(ValueError, 'c.txt:2: '):
+            next(records)
+
+    def test_stdin_same_as_file(self):
+        os.makedirs(os.path.join(self.tmpdir, 'a'))
+        self._write('a/base.txt', 'nova\nsix; python_version < "3"\n')
+        top = self._write('top.txt', '-r a/base.txt\n-r a/base.txt\n'
+                                     'Babel\n')
+        with open(top) as f:
+            lines = f.read()
+        ret, out, err = self._run('--dist', 'fedora', '-b', '-r', top)
+        self.assertEqual(out, 'openstack-nova\npython-babel\n')
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        self.addCleanup(os.chdir, cwd)
+        with mock.patch.object(sys, 'stdin', io.StringIO(lines)):
+            ret, out, err = self._run('--dist', 'fedora', '-b', '-r', '-')
+        self.assertEqual(out, 'openstack-nova\npython-babel\n')
+
+    def test_stdin(self):
+        parse_requirement = requirements.parse_requirement
+        with mock.patch.object(sys, 'stdin', io.StringIO('nova\nBabel\n')), \
+                mock.patch.object(requirements, 'parse_requirement',
+                                  wraps=parse_requirement) as parse:
+            ret, out, err = self._run('--dist', 'all', '-b', '-r', '-')
+        # parsed once for all the dists
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(ret, 0)
+        self.assertIn('[ubuntu]\npython-nova\npython-babel\n', out)
+        self.assertIn('[rdo]\nopenstack-nova\npython-babel\n', out)
+
+    def test_result_cache(self):
+        self._write('shared.txt', 'Babel\n')
+        reqs = self._write('a.txt', 'nova\n-r shared.txt\n')
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        argv = ('--dist', 'fedora', '-b', '--cache-dir', cache_dir,
+                '-r', reqs)
+        ret, out, err = self._run(*argv)
+        self.assertEqual(out, 'openstack-nova\npython-babel\n')
+        with mock.patch.object(requirements, 'parse_requirements') as parse:
+            ret, out, err = self._run(*argv)
+        self.assertFalse(parse.called)
+        self.assertEqual(out, 'openstack-nova\npython-babel\n')
+        # changing an include invalidates the entry
+        self._write('shared.txt', 'oslo.db\n')
+        ret, out, err = self._run(*argv)
+        self.assertEqual(out, 'openstack-nova\npython-oslo-db\n')
+
+    def test_result_cache_keyed_by_path(self):
+        for project, service in (('a', 'nova'), ('b', 'glance')):
+            os.makedirs(os.path.join(self.tmpdir, project))
+            self._write(project + '/base.txt', service + '\n')
+            self._write(project + '/requirements.txt', '-r base.txt\n')
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        for project, pkg in (('a', 'openstack-nova'),
+                             ('b', 'openstack-glance')):
+            ret, out, err = self._run(
+                '--dist', 'fedora', '-b', '--cache-dir', cache_dir, '-r',
+                os.path.join(self.tmpdir, project, 'requirements.txt'))
+            self.assertEqual(out, pkg + '\n')
+
+    def test_result_cache_evicts(self):
+        cache = requirements.ResultCache(
+            os.path.join(self.tmpdir, 'cache'), max_size=0)
+        reqs = self._write('a.txt', 'nova\n')
+        env = requirements.marker_environment('fedora', 'py')
+        cache.put(reqs, [reqs], 'fedora', ['py'], env, ['openstack-nova'])
+        self.assertEqual(cache.get(reqs, 'fedora', ['py'], env),
+                         ['openstack-nova'])
+        cache.evict()
+        self.assertIsNone(cache.get(reqs, 'fedora', ['py'], env))
+
+
+class ServeTests(unittest.TestCase):
+    def _serve(self, lines, dist='fedora', pyversions=('py',),
+               upstream=False):
+        out = io.StringIO()
+        pymod2pkg_cli.serve(io.StringIO(''.join(lines)), out, dist,
+                            list(pyversions), upstream)
+        return out.getvalue().splitlines()
+
+    def test_plain_lines(self):
+        self.assertEqual(self._serve(['nova\n', '\n', 'Babel\n'],
+                                     pyversions=['py2', 'py3']),
+                         ['openstack-nova openstack-nova',
+                          'python-babel python3-babel'])
+        self.assertEqual(self._serve(['keystoneauth1\n'], upstream=True),
+                         ['keystoneauth'])
+
+    def test_json_lines(self):
+        answers = self._serve([
+            '{"mod": "nova", "dist": "ubuntu", "pyver": "py3"}\n',
+            '{"mod": "Babel"}\n',
+            '{"mod": "Babel", "pyver": ["py4"]}\n',
+        ])
+        self.assertEqual(json.loads(answers[0]),
+                         {'mod': 'nova', 'dist': 'ubuntu',
+                          'pkgs': ['python3-nova']})
+        self.assertEqual(json.loads(answers[1]),
+                         {'mod': 'Babel', 'dist': 'fedora',
+                          'pkgs': ['python-babel']})
+        self.assertIn('error', json.loads(answers[2]))
+
+    def test_socket_cleanup(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'sock')
+        # left behind by a server that is gone
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        with mock.patch('socketserver.BaseServer.serve_forever',
+                        side_effect=KeyboardInterrupt):
+            self.assertEqual(pymod2pkg_cli.serve_socket(
+                path, 'fedora', ['py'], False), 0)
+        self.assertFalse(os.path.exists(path))
+
+    def test_socket_in_use(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen(1)
+            with contextlib.redirect_stderr(io.StringIO()) as err:
+                self.assertEqual(pymod2pkg_cli.serve_socket(
+                    path, 'fedora', ['py'], False), 1)
+            self.assertIn('in use', err.getvalue())
+            self.assertTrue(os.path.exists(path))
+
+
+class CliStartupTests(unittest.TestCase):
+    def test_no_detection_with_dist(self):
+        script = ('import sys; from pymod2pkg.cli import pymod2pkg; '
+                  'sys.argv = ["pymod2pkg", "--dist", "fedora", "nova"]; '
+                  'pymod2pkg.main(); '
+                  'from pymod2pkg.cli import reqs2pkg; '
+                  'print(sorted(m for m in ("distro", "packaging", "socket") '
+                  'if m in sys.modules))')
+        out = subprocess.check_output(
+            [sys.executable, '-c', script], universal_newlines=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out, 'openstack-nova\n[]\n')
+
 
 if __name__ == '__main__':
     unittest.main()